@@ -0,0 +1,145 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from game_archive import encode_move, decode_move
+
+# File layout: header, then a fixed number of buckets of SLOTS_PER_BUCKET slots.
+# A slot is (check, score, info): info packs depth (bits 0-7), move (bits 8-23, 0xFFFF for none),
+# the generation it was written in (bits 24-39) and a written flag (bit 40). check is the position hash
+# XOR the other two fields, so a slot torn by two processes writing at once fails to match on the next read.
+MAGIC = b'CHSCACH1'
+HEADER = struct.Struct('<8sQQ')
+SLOT = struct.Struct('<QdQ')
+SLOTS_PER_BUCKET = 4
+NO_MOVE = 0xFFFF
+MAX_DEPTH = 0xFF
+DEFAULT_SIZE = 64 * 1024 * 1024
+
+
+def _score_bits(score):
+    return struct.unpack('<Q', struct.pack('<d', score))[0]
+
+
+class AnalysisCache:
+    """A fixed-size, memory-mapped table of search results (hash, depth, score, best move) that outlives the process.
+
+    When a bucket is full the shallowest entry from an older generation is replaced first, so deep analysis
+    survives while stale shallow results are recycled. Each opened cache starts a new generation.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_SIZE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(path):
+            buckets = max(1, (max_bytes - HEADER.size) // (SLOT.size * SLOTS_PER_BUCKET))
+            with open(path, 'wb') as cache_file:
+                cache_file.write(HEADER.pack(MAGIC, buckets, 0))
+                cache_file.truncate(HEADER.size + buckets * SLOTS_PER_BUCKET * SLOT.size)
+        with open(path, 'r+b') as cache_file:
+            self.mmap = mmap.mmap(cache_file.fileno(), 0)
+        magic, self.buckets, generation = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not an analysis cache")
+        self.generation = (generation + 1) & 0xFFFF
+        HEADER.pack_into(self.mmap, 0, MAGIC, self.buckets, self.generation)
+
+    def __getstate__(self):
+        # Worker processes map the same file, so their results are shared with the parent
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.hits = 0
+        self.misses = 0
+        with open(self.path, 'r+b') as cache_file:
+            self.mmap = mmap.mmap(cache_file.fileno(), 0)
+        _, self.buckets, self.generation = HEADER.unpack_from(self.mmap, 0)
+
+    def __len__(self):
+        return sum(1 for offset in self._all_offsets() if SLOT.unpack_from(self.mmap, offset)[2] != 0)
+
+    def _all_offsets(self):
+        return range(HEADER.size, HEADER.size + self.buckets * SLOTS_PER_BUCKET * SLOT.size, SLOT.size)
+
+    def _bucket_offsets(self, key):
+        first = HEADER.size + (key % self.buckets) * SLOTS_PER_BUCKET * SLOT.size
+        return range(first, first + SLOTS_PER_BUCKET * SLOT.size, SLOT.size)
+
+    def _read(self, offset, key):
+        check, score, info = SLOT.unpack_from(self.mmap, offset)
+        if info == 0 or check ^ _score_bits(score) ^ info != key:
+            return None
+        return score, info
+
+    def get(self, key, depth=0):
+        """(depth, score, (from_pos, to_pos) or None) searched at least depth plies deep, or None."""
+        for offset in self._bucket_offsets(key):
+            found = self._read(offset, key)
+            if found is None:
+                continue
+            score, info = found
+            if info & 0xFF < depth:
+                break
+            self.hits += 1
+            move = (info >> 8) & 0xFFFF
+            return info & 0xFF, score, None if move == NO_MOVE else decode_move(move)
+        self.misses += 1
+        return None
+
+    def put(self, key, depth, score, move):
+        depth = min(depth, MAX_DEPTH)
+        # Bit 40 marks the slot as written, so that an all-zero slot always reads as empty
+        info = depth | ((NO_MOVE if move is None else encode_move(*move)) << 8) | (self.generation << 24) | (1 << 40)
+        victim = None
+        victim_rank = None
+        for offset in self._bucket_offsets(key):
+            found = self._read(offset, key)
+            if found is not None:
+                if found[1] & 0xFF > depth:
+                    return  # a deeper result for this position is already stored
+                victim = offset
+                break
+            # Empty slots first, then entries from older generations, then the shallowest
+            slot_info = SLOT.unpack_from(self.mmap, offset)[2]
+            rank = (slot_info != 0, (slot_info >> 24) & 0xFFFF == self.generation, slot_info & 0xFF)
+            if victim_rank is None or rank < victim_rank:
+                victim, victim_rank = offset, rank
+        SLOT.pack_into(self.mmap, victim, key ^ _score_bits(score) ^ info, score, info)
+
+    def clear(self):
+        self.mmap[HEADER.size:] = bytes(len(self.mmap) - HEADER.size)
+
+    def close(self):
+        if not self.mmap.closed:
+            self.mmap.flush()
+            self.mmap.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or reset a persistent analysis cache.")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('path', nargs='?', default='analysis.cache')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"{args.path} does not exist")
+        return 1
+    cache = AnalysisCache(args.path)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cleared {args.path}")
+    else:
+        slots = cache.buckets * SLOTS_PER_BUCKET
+        used = len(cache)
+        print(f"{used}/{slots} slots used ({100 * used / slots:.1f}%), {len(cache.mmap) // 1024} KiB")
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
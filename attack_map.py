@@ -0,0 +1,32 @@
+from chess_pieces import PIECE_TYPES
+
+
+class AttackMap:
+    """Pieces, move lists and per-square attack counts for one position, built with a single move generation."""
+
+    def __init__(self, game_manager):
+        self.pieces = {}  # pos -> (piece, color)
+        self.moves = {}  # pos -> target squares, as returned by get_valid_moves
+        self.attacks = {'white': [0] * 64, 'black': [0] * 64}
+        self.mobility = {'white': 0, 'black': 0}
+
+        for color in ['white', 'black']:
+            attacks = self.attacks[color]
+            for piece in PIECE_TYPES:
+                board = getattr(game_manager, f"{color}_{piece}")
+                while board:
+                    pos = (board & -board).bit_length() - 1
+                    board &= board - 1
+                    moves = game_manager.get_piece_moves(pos, piece, color)
+                    self.pieces[pos] = (piece, color)
+                    self.moves[pos] = moves
+                    self.mobility[color] += len(moves)
+                    for target in moves:
+                        if 0 <= target < 64:
+                            attacks[target] += 1
+
+    def is_attacked(self, pos, by_color):
+        return 0 <= pos < 64 and self.attacks[by_color][pos] > 0
+
+    def has_moves(self):
+        return any(self.moves.values())
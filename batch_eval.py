@@ -0,0 +1,111 @@
+import numpy as np
+from game_manager import BITBOARD_NAMES
+from precomputed import table
+
+# Bitboard columns follow BITBOARD_NAMES: white pawns..kings, then black pawns..kings
+PIECE_VALUES = np.array([1, 5, 3, 3.5, 9, 200])  # pawns, rooks, knights, bishops, queens, kings
+CENTER_MASK = np.uint64((1 << 27) | (1 << 28) | (1 << 35) | (1 << 36))
+CENTER_CONTROL_WEIGHT = 2
+DOUBLED_PENALTY = -1
+PASSED_PAWN_BONUS = 2
+PAWN_SHIELD_BONUS = 1
+
+FILE_MASKS = [np.uint64(0x0101010101010101 << file) for file in range(8)]
+RANK_MASKS = [np.uint64(0xFF << (rank * 8)) for rank in range(8)]
+
+_shield_masks = None
+
+
+def popcount(boards):
+    boards = np.asarray(boards, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(boards).astype(np.int64)
+    # SWAR popcount for numpy versions without bitwise_count
+    boards = boards - ((boards >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    boards = (boards & np.uint64(0x3333333333333333)) + ((boards >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    boards = (boards + (boards >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((boards * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def lowest_square(boards):
+    # Index of the lowest set bit, or 64 for an empty board (find_king's -1)
+    boards = np.asarray(boards, dtype=np.uint64)
+    lowest = boards & (~boards + np.uint64(1))
+    return popcount(lowest - np.uint64(1))
+
+
+def shield_masks():
+    # Pawn squares that count as a shield for each king square, derived from has_pawn_shield itself
+    global _shield_masks
+    if _shield_masks is None:
+        _shield_masks = np.array(table('shield_masks'), dtype=np.uint64)
+    return _shield_masks
+
+
+def bitboards_from_game_managers(game_managers):
+    return np.array([game_manager.get_bitboards() for game_manager in game_managers], dtype=np.uint64)
+
+
+def evaluate_material(bitboards):
+    counts = popcount(bitboards)
+    return (counts[:, :6] - counts[:, 6:]) @ PIECE_VALUES
+
+
+def evaluate_center_control(bitboards):
+    white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+    return CENTER_CONTROL_WEIGHT * (popcount(white & CENTER_MASK) - popcount(black & CENTER_MASK))
+
+
+def _doubled_pawns(pawns):
+    # is_pawn_doubled counts the pawns on the rank whose index equals the pawn's file
+    doubled = np.zeros(len(pawns), dtype=np.int64)
+    for file in range(8):
+        on_rank = popcount(pawns & RANK_MASKS[file])
+        doubled += np.where(on_rank > 1, popcount(pawns & FILE_MASKS[file]), 0)
+    return doubled
+
+
+def _passed_pawns(pawns, color):
+    # is_pawn_passed fails when an own pawn stands two or more ranks ahead on the same file
+    ahead = np.zeros_like(pawns)
+    for ranks in range(2, 8):
+        shift = np.uint64(8 * ranks)
+        ahead |= (pawns >> shift) if color == 'white' else (pawns << shift)
+    return popcount(pawns) - popcount(pawns & ahead)
+
+
+def evaluate_pawn_structure(bitboards):
+    white_pawns = bitboards[:, 0]
+    black_pawns = bitboards[:, 6]
+    white = DOUBLED_PENALTY * _doubled_pawns(white_pawns) + PASSED_PAWN_BONUS * _passed_pawns(white_pawns, 'white')
+    black = DOUBLED_PENALTY * _doubled_pawns(black_pawns) + PASSED_PAWN_BONUS * _passed_pawns(black_pawns, 'black')
+    return white - black
+
+
+def evaluate_king_safety(bitboards):
+    masks = shield_masks()
+    white = (bitboards[:, 0] & masks[lowest_square(bitboards[:, 5])]) != 0
+    black = (bitboards[:, 6] & masks[lowest_square(bitboards[:, 11])]) != 0
+    return PAWN_SHIELD_BONUS * (white.astype(np.int64) - black.astype(np.int64))
+
+
+def evaluate_batch(bitboards, turn=None):
+    """Evaluate N positions given as an (N, 12) uint64 array in BITBOARD_NAMES order.
+
+    Returns a dict of float arrays with the material, center_control, pawn_structure
+    and king_safety terms of GameManager.evaluate_board. Scores are from white's side
+    unless turn gives +1 (white) or -1 (black) per position.
+    """
+    bitboards = np.asarray(bitboards, dtype=np.uint64)
+    if bitboards.ndim != 2 or bitboards.shape[1] != len(BITBOARD_NAMES):
+        raise ValueError(f"expected an (N, {len(BITBOARD_NAMES)}) bitboard array, got {bitboards.shape}")
+
+    terms = {
+        "material": evaluate_material(bitboards),
+        "center_control": evaluate_center_control(bitboards),
+        "pawn_structure": evaluate_pawn_structure(bitboards),
+        "king_safety": evaluate_king_safety(bitboards)
+    }
+    sign = 1 if turn is None else np.asarray(turn)
+    return {name: (sign * score).astype(np.float64) for name, score in terms.items()}
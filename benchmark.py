@@ -0,0 +1,142 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from game_manager import GameManager
+from move_generator import MoveGenerator
+
+# Representative positions: opening, open and closed middlegames, and endings
+POSITIONS = {
+    'start': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'italian': 'r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'closed': 'r1bq1rk1/pp2nppp/2n1p3/2ppP3/3P4/P1PB1N2/2P2PPP/R1BQK2R b KQ - 1 9',
+    'rook_ending': '8/5pk1/6p1/8/3R4/6P1/r4PK1/8 w - - 0 40',
+    'pawn_ending': '8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 1'
+}
+# Lower is better for these metrics, higher for the rest
+LOWER_IS_BETTER = {'time_to_depth', 'peak_memory_kib'}
+# Small peaks move by a few KiB from run to run, so memory changes below this are never regressions
+MEMORY_SLACK_KIB = 64
+BASELINE_VERSION = 1
+
+
+def bench_position(fen, depth, evaluations, processes, repeat, memory):
+    game_manager = GameManager()
+    game_manager.load_fen(fen)
+    color = 1 if game_manager.turn == 'white' else -1
+
+    # Best of several runs, since move ordering is shuffled and timings are noisy
+    best_time = None
+    nodes = 0
+    for _ in range(repeat):
+        # Every run starts with an empty pawn hash, so runs and positions do not warm each other up
+        GameManager.pawn_hash.clear()
+        move_generator = MoveGenerator()
+        start = time.perf_counter()
+        if processes > 1:
+            move_generator.parallel_search(game_manager, depth, color, processes)
+        else:
+            move_generator.search(game_manager, color, depth=depth)
+        elapsed = time.perf_counter() - start
+        if best_time is None or elapsed < best_time:
+            best_time, nodes = elapsed, move_generator.nodes
+
+    best_eval_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(evaluations):
+            game_manager.evaluate_board(game_manager.turn)
+        elapsed = time.perf_counter() - start
+        best_eval_time = elapsed if best_eval_time is None else min(best_eval_time, elapsed)
+
+    result = {
+        'time_to_depth': best_time,
+        'evals_per_sec': evaluations / best_eval_time
+    }
+    # parallel_search counts its nodes in the workers, so nodes and nps are only known for the serial search
+    if processes <= 1:
+        result['nodes'] = nodes
+        result['nps'] = nodes / best_time
+    if memory:
+        # A separate pass, since tracing allocations slows everything it measures
+        GameManager.pawn_hash.clear()
+        tracemalloc.start()
+        MoveGenerator().search(game_manager, color, depth=depth)
+        result['peak_memory_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, metric, baseline value, value, change) for every metric worse than baseline by more than tolerance."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(name, {}).get(metric)
+            if expected is None or metric == 'nodes' or not expected:
+                continue
+            change = (value - expected) / expected
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if metric == 'peak_memory_kib' and value - expected < MEMORY_SLACK_KIB:
+                worse = False
+            if worse:
+                regressions.append((name, metric, expected, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time searches and evaluations on fixed positions and check them against a baseline.")
+    parser.add_argument('--depth', type=int, default=2, help="search depth for every position")
+    parser.add_argument('--evaluations', type=int, default=200, help="evaluate_board calls per position")
+    parser.add_argument('--processes', type=int, default=1, help="above 1, benchmark parallel_search with this many workers")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement; the fastest is kept")
+    parser.add_argument('--positions', nargs='+', choices=sorted(POSITIONS), default=list(POSITIONS))
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory pass")
+    parser.add_argument('--baseline', default=None, help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown as a fraction, e.g. 0.15 for 15%%")
+    parser.add_argument('--save', default=None, help="write these results as a baseline")
+    args = parser.parse_args(argv)
+
+    settings = {'depth': args.depth, 'evaluations': args.evaluations, 'processes': args.processes}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('version') != BASELINE_VERSION or baseline.get('settings') != settings:
+            print(f"{args.baseline} was recorded with {baseline.get('settings')}, not {settings}")
+            return 2
+
+    results = {}
+    for name in args.positions:
+        metrics = bench_position(POSITIONS[name], args.depth, args.evaluations, args.processes, args.repeat,
+                                 not args.no_memory)
+        results[name] = metrics
+        line = f"{name:12s} depth {args.depth} in {metrics['time_to_depth']:.3f}s  {metrics['evals_per_sec']:.0f} evals/s"
+        if 'nps' in metrics:
+            line += f"  {metrics['nodes']} nodes  {metrics['nps']:.0f} nps"
+        if 'peak_memory_kib' in metrics:
+            line += f"  peak {metrics['peak_memory_kib']:.0f} KiB"
+        print(line, flush=True)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'version': BASELINE_VERSION, 'settings': settings, 'results': results}, baseline_file, indent=2)
+        print(f"Saved baseline to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline['results'], args.tolerance)
+        print()
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+            return 0
+        for name, metric, expected, value, change in regressions:
+            print(f"REGRESSION {name} {metric}: {expected:.4g} -> {value:.4g} ({change:+.1%})")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import numpy as np
+from game_manager import GameManager, BITBOARD_NAMES
+from batch_eval import popcount, lowest_square
+from precomputed import table
+
+SQUARE_BITS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+FILE_A = np.uint64(0x0101010101010101)
+FILE_H = np.uint64(0x8080808080808080)
+RANK_3 = np.uint64(0x0000000000FF0000)
+RANK_6 = np.uint64(0x0000FF0000000000)
+ALL_SQUARES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+ROOK_DIRECTIONS = [8, -8, 1, -1]
+BISHOP_DIRECTIONS = [9, 7, -7, -9]
+
+PAWNS, ROOKS, KNIGHTS, BISHOPS, QUEENS, KINGS = range(6)
+
+_step_tables = None
+
+
+def _shift(boards, direction):
+    # Move every bit one step in a board direction, dropping bits that would wrap around a file
+    if direction > 0:
+        boards = boards << np.uint64(direction)
+    else:
+        boards = boards >> np.uint64(-direction)
+    if direction in (1, 9, -7):
+        boards &= ~FILE_A
+    elif direction in (-1, -9, 7):
+        boards &= ~FILE_H
+    return boards
+
+
+def step_tables():
+    # Knight and king targets per square, as on an empty board
+    global _step_tables
+    if _step_tables is None:
+        _step_tables = (np.array(table('knight_masks'), dtype=np.uint64),
+                        np.array(table('king_masks'), dtype=np.uint64))
+    return _step_tables
+
+
+class BoardBatch:
+    """Many positions held as an (N, 12) uint64 array in BITBOARD_NAMES order, with turn +1 (white) or -1 (black)."""
+
+    def __init__(self, bitboards, turn=None):
+        self.bitboards = np.array(bitboards, dtype=np.uint64).reshape(-1, len(BITBOARD_NAMES))
+        if turn is None:
+            turn = np.ones(len(self.bitboards))
+        self.turn = np.array(turn, dtype=np.int8).reshape(len(self.bitboards))
+
+    @classmethod
+    def initial(cls, count):
+        bitboards = np.tile(np.array(GameManager().get_bitboards(), dtype=np.uint64), (count, 1))
+        return cls(bitboards)
+
+    @classmethod
+    def from_game_managers(cls, game_managers):
+        bitboards = [game_manager.get_bitboards() for game_manager in game_managers]
+        turn = [1 if game_manager.turn == 'white' else -1 for game_manager in game_managers]
+        return cls(bitboards, turn)
+
+    def to_game_manager(self, index):
+        game_manager = GameManager()
+        game_manager.set_bitboards(self.bitboards[index])
+        game_manager.turn = 'white' if self.turn[index] == 1 else 'black'
+        return game_manager
+
+    def __len__(self):
+        return len(self.bitboards)
+
+    def apply_moves(self, from_squares, to_squares):
+        """Play one move per board, following GameManager.make_move; boards with a negative from square are skipped."""
+        from_squares = np.asarray(from_squares, dtype=np.int64)
+        to_squares = np.asarray(to_squares, dtype=np.int64)
+        active = (from_squares >= 0) & (to_squares >= 0)
+        from_bits = np.where(active, SQUARE_BITS[np.clip(from_squares, 0, 63)], np.uint64(0))
+        to_bits = np.where(active, SQUARE_BITS[np.clip(to_squares, 0, 63)], np.uint64(0))
+
+        # The moving piece is the first bitboard holding the from square, as in get_piece_at_position
+        holds_piece = (self.bitboards & from_bits[:, None]) != 0
+        moved = np.argmax(holds_piece, axis=1)
+        has_piece = holds_piece.any(axis=1)
+
+        # Pawns reaching the last rank become queens of the same color
+        to_rank = to_squares // 8
+        promoted = has_piece & (((moved == PAWNS) & (to_rank == 7)) | ((moved == 6 + PAWNS) & (to_rank == 0)))
+        placed = np.where(promoted, moved + (QUEENS - PAWNS), moved)
+
+        # Captures and the vacated square, then the moved piece on its target
+        self.bitboards &= ~(from_bits | to_bits)[:, None]
+        rows = np.nonzero(has_piece)[0]
+        self.bitboards[rows, placed[rows]] |= to_bits[rows]
+
+        # Castling also brings the rook across the king
+        kingside = to_squares > from_squares
+        castled = has_piece & ((moved == KINGS) | (moved == 6 + KINGS)) & (np.abs(to_squares - from_squares) == 2)
+        rook_column = np.where(moved == KINGS, ROOKS, 6 + ROOKS)
+        rook_from = SQUARE_BITS[np.clip(np.where(kingside, from_squares + 3, from_squares - 4), 0, 63)]
+        rook_to = SQUARE_BITS[np.clip(np.where(kingside, from_squares + 1, from_squares - 1), 0, 63)]
+        rows = np.nonzero(castled)[0]
+        rows = rows[(self.bitboards[rows, rook_column[rows]] & rook_from[rows]) != 0]
+        self.bitboards[rows, rook_column[rows]] &= ~rook_from[rows]
+        self.bitboards[rows, rook_column[rows]] |= rook_to[rows]
+
+        self.turn[active] *= -1
+
+    def move_masks(self):
+        """Pseudo-legal targets for the side to move as an (N, 64) uint64 array indexed by origin square."""
+        white_to_move = (self.turn == 1)[:, None]
+        own_boards = np.where(white_to_move, self.bitboards[:, :6], self.bitboards[:, 6:])
+        enemy_boards = np.where(white_to_move, self.bitboards[:, 6:], self.bitboards[:, :6])
+        own = np.bitwise_or.reduce(own_boards, axis=1)[:, None]
+        enemy = np.bitwise_or.reduce(enemy_boards, axis=1)[:, None]
+        empty = ~(own | enemy)
+
+        def origins(piece_board):
+            return piece_board[:, None] & SQUARE_BITS[None, :]
+
+        masks = np.zeros((len(self), 64), dtype=np.uint64)
+
+        # Pawns: single and double pushes, diagonal captures
+        pawns = origins(own_boards[:, PAWNS])
+        white_push = _shift(pawns, 8) & empty
+        white_push |= _shift(white_push & RANK_3, 8) & empty
+        white_captures = (_shift(pawns, 7) | _shift(pawns, 9)) & enemy
+        black_push = _shift(pawns, -8) & empty
+        black_push |= _shift(black_push & RANK_6, -8) & empty
+        black_captures = (_shift(pawns, -7) | _shift(pawns, -9)) & enemy
+        masks |= np.where(white_to_move, white_push | white_captures, black_push | black_captures)
+
+        # Knights and kings from the step tables
+        knight_table, king_table = step_tables()
+        has_knight = origins(own_boards[:, KNIGHTS]) != 0
+        masks |= np.where(has_knight, knight_table[None, :] & ~own, np.uint64(0))
+        has_king = origins(own_boards[:, KINGS]) != 0
+        masks |= np.where(has_king, king_table[None, :] & ~own, np.uint64(0))
+
+        # Sliders: rays stop on the first occupied square, which is kept unless it is our own
+        straight = origins(own_boards[:, ROOKS] | own_boards[:, QUEENS])
+        diagonal = origins(own_boards[:, BISHOPS] | own_boards[:, QUEENS])
+        for sliders, directions in ((straight, ROOK_DIRECTIONS), (diagonal, BISHOP_DIRECTIONS)):
+            # Only origin squares that hold a slider on some board need rays
+            columns = np.nonzero((sliders != 0).any(axis=0))[0]
+            sliders = sliders[:, columns]
+            attacks = np.zeros_like(sliders)
+            for direction in directions:
+                ray = sliders
+                for _ in range(7):
+                    ray = _shift(ray, direction)
+                    attacks |= ray
+                    ray &= empty
+                    if not ray.any():
+                        break
+            masks[:, columns] |= attacks & ~own
+
+        # The simplified castling rule from GameManager.king_moves
+        occupied = (own | enemy)[:, 0]
+        kings = own_boards[:, KINGS]
+        rooks = own_boards[:, ROOKS]
+        home = np.where(white_to_move[:, 0], 0, 56).astype(np.uint64)
+        king_home = np.left_shift(np.uint64(1), home + np.uint64(4))
+        on_home = kings == king_home
+        for rook_file, between, target in ((7, 0b01100000, 6), (0, 0b00001110, 2)):
+            rook_bit = np.left_shift(np.uint64(1), home + np.uint64(rook_file))
+            between_bits = np.left_shift(np.uint64(between), home)
+            can_castle = on_home & ((rooks & rook_bit) != 0) & ((occupied & between_bits) == 0)
+            target_bits = np.left_shift(np.uint64(1), home + np.uint64(target))
+            king_square = (home + np.uint64(4)).astype(np.int64)
+            rows = np.nonzero(can_castle)[0]
+            masks[rows, king_square[rows]] |= target_bits[rows]
+
+        return masks
+
+    def sample_moves(self, masks, rng):
+        """Pick one target per board uniformly among all moves in masks; boards without moves get (-1, -1)."""
+        counts = popcount(masks)
+        totals = counts.sum(axis=1)
+        rows = np.arange(len(masks))
+        choice = np.floor(rng.random(len(masks)) * totals).astype(np.int64)
+        cumulative = np.cumsum(counts, axis=1)
+        from_squares = np.argmax(cumulative > choice[:, None], axis=1)
+        skip = choice - (cumulative[rows, from_squares] - counts[rows, from_squares])
+
+        targets = masks[rows, from_squares]
+        while (skip > 0).any():
+            targets = np.where(skip > 0, targets & (targets - np.uint64(1)), targets)
+            skip -= 1
+        to_squares = lowest_square(targets)
+
+        has_moves = totals > 0
+        return np.where(has_moves, from_squares, -1), np.where(has_moves, to_squares, -1)
+
+    def play_random_moves(self, plies, rng=None):
+        # Random pseudo-legal playout on every board; boards that run out of moves stop in place
+        rng = np.random.default_rng() if rng is None else rng
+        for _ in range(plies):
+            from_squares, to_squares = self.sample_moves(self.move_masks(), rng)
+            if (from_squares < 0).all():
+                break
+            self.apply_moves(from_squares, to_squares)
+        return self
@@ -1,3 +1,6 @@
+# Bitboard piece types, in the order GameManager looks them up
+PIECE_TYPES = ['pawns', 'rooks', 'knights', 'bishops', 'queens', 'kings']
+
 class ChessPiece:
     def __init__(self, position, color):
         self.row, self.col = position
@@ -0,0 +1,148 @@
+import argparse
+import multiprocessing
+import shlex
+import sys
+import time
+
+from analysis_cache import AnalysisCache
+from game_manager import GameManager
+from move_generator import MoveGenerator
+from pgn import move_to_san
+
+DEFAULT_DEPTH = 3
+# With --movetime the clock, not the depth, ends the search
+MAX_DEPTH = 64
+
+
+def parse_epd(line):
+    """Split an EPD record into a FEN (with default move counters) and its operations.
+
+    'r1b...w KQkq - bm Nf3 Bc4; id "test 1";' gives
+    ('r1b... w KQkq - 0 1', {'bm': ['Nf3', 'Bc4'], 'id': ['test 1']}).
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"Invalid EPD '{line.strip()}': expected 4 position fields")
+    fen = ' '.join(fields[:4]) + ' 0 1'
+    operations = {}
+    if len(fields) == 5:
+        for operation in fields[4].split(';'):
+            tokens = shlex.split(operation)
+            if tokens:
+                operations[tokens[0]] = tokens[1:]
+    return fen, operations
+
+
+def format_epd(game_manager, operations=None):
+    position = ' '.join(game_manager.to_fen().split()[:4])
+    parts = [position]
+    for opcode, operands in (operations or {}).items():
+        quoted = [f'"{operand}"' if ' ' in operand or not operand else operand for operand in operands]
+        parts.append(' '.join([opcode] + quoted) + ';')
+    return ' '.join(parts)
+
+
+def strip_san(san):
+    return san.rstrip('+#!?')
+
+
+def solve_position(task):
+    # Iterative deepening on one position; the solution time is when the final, correct answer first appeared
+    index, fen, operations, max_depth, movetime, cache = task
+    game_manager = GameManager()
+    game_manager.load_fen(fen)
+    move_generator = MoveGenerator(cache=cache)
+    color = 1 if game_manager.turn == 'white' else -1
+    best_moves = {strip_san(san) for san in operations.get('bm', [])}
+    avoid_moves = {strip_san(san) for san in operations.get('am', [])}
+    legal_moves = game_manager.get_legal_moves(game_manager.turn)
+
+    start = time.perf_counter()
+    deadline = start + movetime if movetime is not None else None
+    solution = {'san': None, 'solved_since': None, 'depth': 0}
+
+    def on_iteration(score, move, pv, depth):
+        from_pos, to_pos = (game_manager.notation_to_pos(square) for square in move)
+        san = strip_san(move_to_san(game_manager, from_pos, to_pos, legal_moves))
+        correct = (not best_moves or san in best_moves) and san not in avoid_moves
+        if not correct:
+            solution['solved_since'] = None
+        elif solution['solved_since'] is None:
+            solution['solved_since'] = time.perf_counter() - start
+        solution.update(san=san, depth=depth)
+
+    def should_stop():
+        # Aborts the iteration in progress at the deadline; the last finished one stands
+        return deadline is not None and time.perf_counter() >= deadline
+
+    move_generator.iterative_search(game_manager, color, max_depth, should_stop, on_iteration)
+    san, solved_since, depth = solution['san'], solution['solved_since'], solution['depth']
+    elapsed = time.perf_counter() - start
+
+    return {
+        'index': index,
+        'id': ' '.join(operations.get('id', [])) or str(index + 1),
+        'move': san,
+        'expected': sorted(best_moves) if best_moves else ['not ' + move for move in sorted(avoid_moves)],
+        'solved': solved_since is not None,
+        'time_to_solution': solved_since,
+        'depth': depth,
+        'nodes': move_generator.nodes,
+        'time': elapsed
+    }
+
+
+def read_suite(path):
+    with open(path) as suite:
+        for line in suite:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield parse_epd(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an EPD test suite of best-move positions.")
+    parser.add_argument('suite', help="EPD file with bm (best move) or am (avoid move) operations")
+    parser.add_argument('--depth', type=int, default=None,
+                        help="deepest iteration per position (default 3, or unlimited with --movetime)")
+    parser.add_argument('--movetime', type=float, default=None, help="stop deepening after this many seconds")
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--min-solved', type=int, default=None, help="exit with status 1 below this many solved")
+    parser.add_argument('--cache', default=None, help="persistent analysis cache shared by runs, e.g. analysis.cache")
+    args = parser.parse_args(argv)
+    if args.depth is None:
+        args.depth = MAX_DEPTH if args.movetime is not None else DEFAULT_DEPTH
+
+    # Opened once here so the whole run is one cache generation; workers map the same file
+    cache = AnalysisCache(args.cache) if args.cache else None
+    tasks = [(index, fen, operations, args.depth, args.movetime, cache)
+             for index, (fen, operations) in enumerate(read_suite(args.suite))]
+
+    solved = 0
+    total_nodes = 0
+    total_time = 0.0
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=args.processes) as pool:
+        for result in pool.imap_unordered(solve_position, tasks):
+            solved += result['solved']
+            total_nodes += result['nodes']
+            total_time += result['time']
+            solution_time = f"{result['time_to_solution']:.2f}s" if result['solved'] else '-'
+            print(f"{result['id']}: {'solved' if result['solved'] else 'failed'} "
+                  f"played {result['move']} expected {' '.join(result['expected'])} "
+                  f"depth {result['depth']} solution time {solution_time} "
+                  f"nodes {result['nodes']} nps {result['nodes'] / max(result['time'], 1e-9):.0f}", flush=True)
+
+    wall_time = time.perf_counter() - start
+    print()
+    print(f"Solved {solved}/{len(tasks)} positions in {wall_time:.1f}s, "
+          f"{total_nodes} nodes, {total_nodes / max(total_time, 1e-9):.0f} nps per process")
+    if cache is not None:
+        cache.close()
+    if args.min_solved is not None and solved < args.min_solved:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
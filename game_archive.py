@@ -0,0 +1,149 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from game_manager import GameManager
+
+# File layout:
+#   header  magic (8 bytes), index offset (uint64, 0 until the writer is closed)
+#   games   move count (uint16), result code (uint8), FEN length (uint8), FEN bytes, moves (uint16 each)
+#   index   one uint64 file offset per game, up to the end of the file
+# A move packs from_pos in bits 0-5 and to_pos in bits 6-11; promotion is implied, pawns always become queens.
+MAGIC = b'CHSARC\x00\x01'
+HEADER = struct.Struct('<8sQ')
+GAME_HEADER = struct.Struct('<HBB')
+RESULTS = ['*', '1-0', '0-1', '1/2-1/2']
+
+
+def encode_move(from_pos, to_pos):
+    return from_pos | (to_pos << 6)
+
+
+def decode_move(move):
+    return move & 0x3F, (move >> 6) & 0x3F
+
+
+class ArchiveWriter:
+    """Appends games to an archive file; the index is written when the writer is closed."""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.offsets = array('Q')
+        if append and os.path.exists(path):
+            self.file = open(path, 'r+b')
+            magic, index_offset = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or index_offset == 0:
+                self.file.close()
+                raise ValueError(f"{path} is not a closed game archive")
+            self.file.seek(index_offset)
+            self.offsets.frombytes(self.file.read())
+            if sys.byteorder == 'big':
+                self.offsets.byteswap()
+            self.file.seek(index_offset)
+            self.file.truncate()
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, 0))
+
+    def add_game(self, moves, result='*', fen=None):
+        if len(moves) > 0xFFFF:
+            raise ValueError(f"Game has {len(moves)} moves, the archive holds at most 65535")
+        fen_bytes = fen.encode('ascii') if fen else b''
+        self.offsets.append(self.file.tell())
+        self.file.write(GAME_HEADER.pack(len(moves), RESULTS.index(result), len(fen_bytes)))
+        self.file.write(fen_bytes)
+        self.file.write(struct.pack(f'<{len(moves)}H', *(encode_move(from_pos, to_pos) for from_pos, to_pos in moves)))
+        return len(self.offsets) - 1
+
+    def add_game_manager(self, game_manager, result='*'):
+        moves = [(move['from_pos'], move['to_pos']) for move in game_manager.move_history]
+        return self.add_game(moves, result, game_manager.start_fen)
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        offsets = array('Q', self.offsets)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+class ArchiveReader:
+    """Random access to archived games through mmap: finding game N is one index lookup, not a scan."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as archive:
+            self.mmap = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.index_offset = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a game archive")
+        if self.index_offset == 0:
+            raise ValueError(f"{path} was not closed by its writer and has no index")
+        self.count = (len(self.mmap) - self.index_offset) // 8
+
+    def __len__(self):
+        return self.count
+
+    def _game(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(f"game {index} out of range for {self.count} games")
+        offset, = struct.unpack_from('<Q', self.mmap, self.index_offset + 8 * index)
+        move_count, result_code, fen_length = GAME_HEADER.unpack_from(self.mmap, offset)
+        fen_start = offset + GAME_HEADER.size
+        return move_count, result_code, fen_start, fen_length
+
+    def result(self, index):
+        return RESULTS[self._game(index)[1]]
+
+    def fen(self, index):
+        _, _, fen_start, fen_length = self._game(index)
+        return self.mmap[fen_start:fen_start + fen_length].decode('ascii') or None
+
+    def moves(self, index):
+        move_count, _, fen_start, fen_length = self._game(index)
+        moves = struct.unpack_from(f'<{move_count}H', self.mmap, fen_start + fen_length)
+        return [decode_move(move) for move in moves]
+
+    def iter_replay(self, index, game_manager=None):
+        # Yields the same GameManager after the start position and after each move
+        game_manager = game_manager or GameManager()
+        fen = self.fen(index)
+        if fen:
+            game_manager.load_fen(fen)
+        else:
+            game_manager.setup_board()
+        yield game_manager
+        for from_pos, to_pos in self.moves(index):
+            game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+            yield game_manager
+
+    def replay(self, index, game_manager=None):
+        for game_manager in self.iter_replay(index, game_manager):
+            pass
+        return game_manager
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.moves(index)
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
@@ -1,6 +1,33 @@
+import time
 import chess_pieces
+from chess_pieces import PIECE_TYPES
+from pawn_hash import PawnHashTable, PawnEntry
+from attack_map import AttackMap
+from search_stats import SearchStats
+from zobrist import hash_bitboards
+
+# Bitboard attribute names, white then black, in PIECE_TYPES order
+BITBOARD_NAMES = [f"{color}_{piece_type}" for color in ['white', 'black'] for piece_type in PIECE_TYPES]
+# (attribute, piece type, color) in the same order, so lookups need no string building
+BITBOARD_KEYS = [(name, name.split('_')[1], name.split('_')[0]) for name in BITBOARD_NAMES]
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_PIECES = {'p': 'pawns', 'r': 'rooks', 'n': 'knights', 'b': 'bishops', 'q': 'queens', 'k': 'kings'}
+
+# Methods timed while statistics are enabled; each evaluation term is reported under its own name
+TIMED_METHODS = [
+    'get_all_moves', 'is_check', 'build_attack_map', 'evaluate_board',
+    'evaluate_material', 'evaluate_pawn_structure', 'evaluate_king_safety', 'evaluate_center_control',
+    'evaluate_mobility', 'evaluate_tactics', 'evaluate_coordination', 'evaluate_development',
+    'evaluate_advanced_king_safety', 'evaluate_pawn_chains_and_blocks'
+]
 
 class GameManager:
+    # Pawn terms shared by every GameManager in the process, keyed on pawns and kings
+    pawn_hash = PawnHashTable()
+    # SearchStats being collected, see enable_stats
+    stats = None
+
     def __init__(self):
         # Bitboards for each piece type and color
         # white
@@ -22,11 +49,56 @@ class GameManager:
         self.valid_moves = []
         self.move_history = []
         self.turn = 'white'
+        # Where move_history starts from, for positions loaded from FEN
+        self.start_fen = None
+        self.start_turn = 'white'
+        self.start_fullmove = 1
 
     def setup_board(self):
         # Reset the board to the initial state
         self.__init__()
 
+    # Statistics
+    def enable_stats(self, stats=None):
+        """Time move generation, is_check and every evaluation term into stats (a new SearchStats by default).
+
+        The timed versions shadow the methods on this instance only, so other GameManagers pay nothing.
+        """
+        self.stats = stats if stats is not None else SearchStats()
+        for name in TIMED_METHODS:
+            setattr(self, name, self._timed(name, getattr(type(self), name), self.stats))
+        self.probe_pawn_hash = self._counted_pawn_hash(self.stats)
+        return self.stats
+
+    def disable_stats(self):
+        for name in TIMED_METHODS + ['probe_pawn_hash']:
+            self.__dict__.pop(name, None)
+        self.__dict__.pop('stats', None)
+
+    def _timed(self, name, method, stats):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.add_time(name, time.perf_counter() - start)
+        return timed
+
+    def _counted_pawn_hash(self, stats):
+        def probe():
+            hits = self.pawn_hash.hits
+            entry = GameManager.probe_pawn_hash(self)
+            stats.add_probe('pawn_hash', self.pawn_hash.hits > hits)
+            return entry
+        return probe
+
+    def __getstate__(self):
+        # Copies sent to worker processes are plain; the worker enables its own statistics
+        state = self.__dict__.copy()
+        for name in TIMED_METHODS + ['probe_pawn_hash', 'stats']:
+            state.pop(name, None)
+        return state
+
     def make_move(self, from_notation, to_notation):
         from_pos = self.notation_to_pos(from_notation)
         to_pos = self.notation_to_pos(to_notation)
@@ -55,6 +127,14 @@ class GameManager:
         else:
             self.update_bitboard(from_pos, piece_moved, moved_color, remove=True)
             self.update_bitboard(to_pos, piece_moved, moved_color, remove=False)
+
+        # Castling also brings the rook across the king
+        if piece_moved == 'kings' and abs(to_pos - from_pos) == 2:
+            rook_from, rook_to = (from_pos + 3, from_pos + 1) if to_pos > from_pos else (from_pos - 4, from_pos - 1)
+            if self.get_piece_at_position(rook_from) == ('rooks', moved_color):
+                self.update_bitboard(rook_from, 'rooks', moved_color, remove=True)
+                self.update_bitboard(rook_to, 'rooks', moved_color, remove=False)
+                move_details['castle'] = (rook_from, rook_to)
         
         # Switch turns
         self.turn = 'black' if self.turn == 'white' else 'white'
@@ -89,11 +169,20 @@ class GameManager:
         if piece_captured:
             self.update_bitboard(to_pos, piece_captured, captured_color, remove=False)
 
+        # Put a castled rook back in its corner
+        if 'castle' in last_move:
+            rook_from, rook_to = last_move['castle']
+            self.update_bitboard(rook_to, 'rooks', moved_color, remove=True)
+            self.update_bitboard(rook_from, 'rooks', moved_color, remove=False)
+
         # Switch turns back
         self.turn = 'black' if self.turn == 'white' else 'white'
 
     def get_valid_moves(self, pos):
         piece, piece_color = self.get_piece_at_position(pos)
+        return self.get_piece_moves(pos, piece, piece_color)
+
+    def get_piece_moves(self, pos, piece, piece_color):
         valid_moves = []
         match piece:
             case 'pawns':
@@ -122,27 +211,40 @@ class GameManager:
             board |= bit  # Place the piece
         setattr(self, f"{color}_{piece_type}", board)
 
+    def get_bitboards(self):
+        return [getattr(self, name) for name in BITBOARD_NAMES]
+
+    def set_bitboards(self, bitboards):
+        for name, board in zip(BITBOARD_NAMES, bitboards):
+            setattr(self, name, int(board))
+
+    def zobrist_hash(self):
+        return hash_bitboards(self.get_bitboards(), self.turn)
+
     def get_piece_at_position(self, pos):
         if type(pos) != int:
             return None, None
         mask = 1 << pos
-        for color in ['white', 'black']:
-            for piece_type in ['pawns', 'rooks', 'knights', 'bishops', 'queens', 'kings']:
-                if getattr(self, f"{color}_{piece_type}") & mask:
-                    return piece_type, color
+        for name, piece_type, color in BITBOARD_KEYS:
+            if getattr(self, name) & mask:
+                return piece_type, color
         return None, None
 
     # Check and moves
-    def is_check(self, color):
+    def is_check(self, color, attack_map=None):
         king_pos = self.find_king(color)
         opposing_color = 'black' if color == 'white' else 'white'
+        if attack_map is not None:
+            return attack_map.is_attacked(king_pos, opposing_color)
         for start_pos, end_pos in self.get_all_moves(opposing_color):
             if king_pos in end_pos:
                 return True
         return False
 
-    def is_checkmate(self, color):
-        if not self.is_check(color):
+    def is_checkmate(self, color, attack_map=None):
+        if not self.is_check(color, attack_map):
+            return False
+        if attack_map is not None and attack_map.has_moves():
             return False
         # Get all moves for the current player
         for pos in range(64):
@@ -157,12 +259,33 @@ class GameManager:
         # Return the position of the king
         return (king_bitboard & -king_bitboard).bit_length() - 1
 
+    def get_legal_moves(self, color):
+        # (from_pos, to_pos) pairs that do not leave color's king in check
+        legal_moves = []
+        for from_pos, targets in self.get_all_moves(color):
+            from_notation = self.pos_to_notation(from_pos)
+            for to_pos in targets:
+                self.make_move(from_notation, self.pos_to_notation(to_pos))
+                if not self.is_check(color):
+                    legal_moves.append((from_pos, to_pos))
+                self.undo_move()
+        return legal_moves
+
+    def build_attack_map(self):
+        return AttackMap(self)
+
     def get_all_moves(self, color):
         moves = []
-        for pos in range(64):
+        # Visit only the squares holding color's pieces, still in ascending order
+        occupied = 0
+        for piece_type in PIECE_TYPES:
+            occupied |= getattr(self, f"{color}_{piece_type}")
+        while occupied:
+            pos = (occupied & -occupied).bit_length() - 1
+            occupied &= occupied - 1
             piece, piece_color = self.get_piece_at_position(pos)
             if piece and (color == piece_color):
-                valid_moves = self.get_valid_moves(pos)
+                valid_moves = self.get_piece_moves(pos, piece, piece_color)
                 if valid_moves:
                     moves.append((pos, valid_moves))
         return moves
@@ -171,17 +294,20 @@ class GameManager:
     # Evaluation
     def evaluate_board(self, turn_color):
         score = 0
-        is_ahead = self.check_if_ahead(turn_color)
+        # One move generation per leaf, shared by every term below
+        attack_map = self.build_attack_map()
+        material = self.evaluate_material(turn_color, attack_map)
+        is_ahead = material > 10
 
         factors = {
-            "material": self.evaluate_material(turn_color),
+            "material": material,
             "pawn_structure": self.evaluate_pawn_structure(turn_color),
             "king_safety": self.evaluate_king_safety(turn_color),
-            "center_control": self.evaluate_center_control(turn_color),
-            "mobility": self.evaluate_mobility(turn_color),
-            "tactics": self.evaluate_tactics(turn_color),
-            "coordination": self.evaluate_coordination(turn_color),
-            "development": self.evaluate_development(turn_color),
+            "center_control": self.evaluate_center_control(turn_color, attack_map),
+            "mobility": self.evaluate_mobility(turn_color, attack_map),
+            "tactics": self.evaluate_tactics(turn_color, attack_map),
+            "coordination": self.evaluate_coordination(turn_color, attack_map),
+            "development": self.evaluate_development(turn_color, attack_map),
             "advanced_king_safety": self.evaluate_advanced_king_safety(turn_color),
             "pawn_chains_blocks": self.evaluate_pawn_chains_and_blocks(turn_color)
         }
@@ -204,17 +330,21 @@ class GameManager:
             score += base_score * multipliers.get(key, 1)
 
         # Check for checkmate situations
-        if self.is_checkmate('white'):
+        if self.is_checkmate('white', attack_map):
             return -200000 if turn_color == 'white' else 200000
-        elif self.is_checkmate('black'):
+        elif self.is_checkmate('black', attack_map):
             return 200000 if turn_color == 'white' else -200000
 
         # Score adjustment based on turn
         return score
 
-    def evaluate_material(self, turn_color):
+    def evaluate_material(self, turn_color, attack_map=None):
         piece_values = {'pawns': 1, 'knights': 3, 'bishops': 3.5, 'rooks': 5, 'queens': 9, 'kings': 200}
         score = 0
+        if attack_map is not None:
+            for piece, color in attack_map.pieces.values():
+                score += piece_values[piece] if color == turn_color else -piece_values[piece]
+            return score
         for pos in range(64):
             piece, color = self.get_piece_at_position(pos)
             if piece:
@@ -225,8 +355,14 @@ class GameManager:
         material_difference = self.evaluate_material(turn_color)
         return material_difference > 10
 
-    def evaluate_tactics(self, turn_color):
+    def evaluate_tactics(self, turn_color, attack_map=None):
         score = 0
+        if attack_map is not None:
+            for pos, (piece, color) in attack_map.pieces.items():
+                # Every target counts as a capture here, matching the filter below
+                if (piece == 'knights' or piece == 'queens') and len(attack_map.moves[pos]) >= 2:
+                    score += 3 if color == turn_color else -3
+            return score
         # This is a simple implementation idea; more detailed checking based on actual piece moves is needed
         for pos in range(64):
             piece, color = self.get_piece_at_position(pos)
@@ -242,8 +378,13 @@ class GameManager:
                             score -= 3
         return score
 
-    def evaluate_coordination(self, turn_color):
+    def evaluate_coordination(self, turn_color, attack_map=None):
         score = 0
+        if attack_map is not None:
+            for pos, (piece, color) in attack_map.pieces.items():
+                if piece == 'bishops' and len(attack_map.moves[pos]) > 4:
+                    score += 1 if color == turn_color else -1
+            return score
         # Check for bishops on long diagonals, rooks on open files, etc.
         for pos in range(64):
             piece, color = self.get_piece_at_position(pos)
@@ -256,13 +397,18 @@ class GameManager:
                         score -= 1
         return score
 
-    def evaluate_development(self, turn_color):
+    def evaluate_development(self, turn_color, attack_map=None):
         score = 0
         early_game = len(self.move_history) < 20  # Adjust as needed for the early game definition
         undeveloped_pieces = {'rooks': 2, 'knights': 3, 'bishops': 3}  # Penalty values for undeveloped pieces
+        if not early_game:
+            return score
 
-        for pos in range(64):
-            piece, color = self.get_piece_at_position(pos)
+        if attack_map is not None:
+            pieces = attack_map.pieces.items()
+        else:
+            pieces = ((pos, self.get_piece_at_position(pos)) for pos in range(64))
+        for pos, (piece, color) in pieces:
             if piece in undeveloped_pieces:
                 if early_game and not self.piece_has_moved(pos):
                     score += undeveloped_pieces[piece] if color == turn_color else -undeveloped_pieces[piece]
@@ -274,6 +420,9 @@ class GameManager:
         return pos in [self.move_history[i]['from_pos'] for i in range(len(self.move_history))]
 
     def evaluate_advanced_king_safety(self, turn_color):
+        return self.probe_pawn_hash().king_exposure
+
+    def compute_advanced_king_safety(self, turn_color='white'):
         score = 0
         # Assuming we already have methods to determine open files or dangerous diagonals
         for color in ['white', 'black']:
@@ -293,17 +442,24 @@ class GameManager:
         return False  # Placeholder for diagonal checks
 
     def evaluate_pawn_chains_and_blocks(self, turn_color):
-        score = 0
-        # Pawn chains and blocked pawns
-        for pos in range(64):
-            piece, color = self.get_piece_at_position(pos)
-            if piece == 'pawns':
+        entry = self.probe_pawn_hash()
+        # Blocked pawns cost the same whichever side is to move
+        return (entry.chains if turn_color == 'white' else -entry.chains) + entry.blocks
+
+    def compute_pawn_chains_and_blocks(self):
+        chains = 0
+        blocks = 0
+        # Pawn chains and blocked pawns, visiting only the squares that hold pawns
+        for color, pawns in (('white', self.white_pawns), ('black', self.black_pawns)):
+            while pawns:
+                pos = (pawns & -pawns).bit_length() - 1
+                pawns &= pawns - 1
                 if self.is_pawn_in_chain(pos, color):
-                    score += 1 if color == turn_color else -1
+                    chains += 1 if color == 'white' else -1
                 if self.is_pawn_blocked(pos, color):
-                    score -= 1 if color == turn_color else 1
+                    blocks -= 1
 
-        return score
+        return chains, blocks
 
     def is_pawn_in_chain(self, pos, color):
         # Check if a pawn is protected by another pawn
@@ -322,6 +478,10 @@ class GameManager:
         return False
 
     def evaluate_pawn_structure(self, turn_color):
+        score = self.probe_pawn_hash().structure
+        return score if turn_color == 'white' else -score
+
+    def compute_pawn_structure(self, turn_color='white'):
         score = 0
         isolated_penalty = 0
         doubled_penalty = -1
@@ -359,6 +519,10 @@ class GameManager:
         return score if turn_color == 'white' else -score
 
     def evaluate_king_safety(self, turn_color):
+        score = self.probe_pawn_hash().king_shield
+        return score if turn_color == 'white' else -score
+
+    def compute_king_safety(self, turn_color='white'):
         score = 0
         pawn_shield_bonus = 1
 
@@ -374,11 +538,34 @@ class GameManager:
 
         return score if turn_color == 'white' else -score
 
-    def evaluate_center_control(self, turn_color):
+    # Pawn hash
+    def probe_pawn_hash(self):
+        key = (self.white_pawns, self.black_pawns, self.white_kings, self.black_kings)
+        entry = self.pawn_hash.get(key)
+        if entry is None:
+            chains, blocks = self.compute_pawn_chains_and_blocks()
+            entry = PawnEntry(
+                structure=self.compute_pawn_structure(),
+                chains=chains,
+                blocks=blocks,
+                king_shield=self.compute_king_safety(),
+                king_exposure=self.compute_advanced_king_safety()
+            )
+            self.pawn_hash.put(key, entry)
+        return entry
+
+    def evaluate_center_control(self, turn_color, attack_map=None):
         score = 0
         center_squares = [27, 28, 35, 36]
         center_control_weight = 2
 
+        if attack_map is not None:
+            for pos in center_squares:
+                piece, color = attack_map.pieces.get(pos, (None, None))
+                if piece:
+                    score += center_control_weight if color == 'white' else -center_control_weight
+            return score if turn_color == 'white' else -score
+
         # Evaluate white pieces
         for pos in range(64):
             piece, color = self.get_piece_at_position(pos)
@@ -395,8 +582,11 @@ class GameManager:
 
         return score if turn_color == 'white' else -score
 
-    def evaluate_mobility(self, turn_color):
+    def evaluate_mobility(self, turn_color, attack_map=None):
         score = 0
+        if attack_map is not None:
+            score = attack_map.mobility['white'] - attack_map.mobility['black']
+            return score if turn_color == 'white' else -score
         for pos in range(64):
             piece, color = self.get_piece_at_position(pos)
             if piece and color == 'white':
@@ -534,13 +724,9 @@ class GameManager:
         # Captures
         for offset in [-1, 1]:
             capture_pos = pos + direction + offset
-            if not (0 <= capture_pos < 64):
-                break
-            # Check if the capture move wraps around the board
-            if pos // 8 == capture_pos // 8 or abs(pos % 8 - capture_pos % 8) == 1:
-                captured_piece, captured_color = self.get_piece_at_position(capture_pos)
-                if captured_piece and captured_color != piece_color:
-                    moves.append(capture_pos)
+            # Skip squares off the board or wrapped around to the other edge
+            if not (0 <= capture_pos < 64) or abs(pos % 8 - capture_pos % 8) != 1:
+                continue
             captured_piece, captured_color = self.get_piece_at_position(capture_pos)
             if captured_piece and captured_color != piece_color:
                 moves.append(capture_pos)
@@ -653,6 +839,75 @@ class GameManager:
                     moves.append(58)
         return moves
 
+    # FEN
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 2:
+            raise ValueError(f"Invalid FEN '{fen}': expected at least placement and side to move")
+        placement, active = fields[0], fields[1]
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError(f"Invalid FEN '{fen}': expected 8 ranks, got {len(rows)}")
+        if active not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN '{fen}': side to move must be 'w' or 'b'")
+
+        # The whole placement is parsed before anything is touched, so a bad FEN leaves the position as it was
+        bitboards = [0] * len(BITBOARD_NAMES)
+        for row_index, row in enumerate(rows):
+            rank = 7 - row_index
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or file > 7:
+                    raise ValueError(f"Invalid FEN '{fen}': bad rank '{row}'")
+                color = 'white' if char.isupper() else 'black'
+                bitboards[BITBOARD_NAMES.index(f"{color}_{FEN_PIECES[char.lower()]}")] |= 1 << (rank * 8 + file)
+                file += 1
+            if file != 8:
+                raise ValueError(f"Invalid FEN '{fen}': rank '{row}' does not cover 8 files")
+        for color in ('white', 'black'):
+            if bin(bitboards[BITBOARD_NAMES.index(f"{color}_kings")]).count('1') != 1:
+                raise ValueError(f"Invalid FEN '{fen}': {color} must have exactly one king")
+
+        self.__init__()
+        self.set_bitboards(bitboards)
+        # Castling rights and en passant are implied by the position in this engine, so those fields are ignored
+        self.turn = 'white' if active == 'w' else 'black'
+        self.start_fen = fen
+        self.start_turn = self.turn
+        if len(fields) >= 6 and fields[5].isdigit():
+            self.start_fullmove = int(fields[5])
+
+    def to_fen(self):
+        rows = []
+        for rank in reversed(range(8)):
+            row = ''
+            empty = 0
+            for file in range(8):
+                piece, color = self.get_piece_at_position(rank * 8 + file)
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = next(key for key, value in FEN_PIECES.items() if value == piece)
+                row += letter.upper() if color == 'white' else letter
+            rows.append(row + (str(empty) if empty else ''))
+
+        # Castling is available whenever king and rook stand on their home squares, as in king_moves
+        castling = ''
+        if self.white_kings == (1 << 4):
+            castling += ('K' if self.white_rooks & (1 << 7) else '') + ('Q' if self.white_rooks & 1 else '')
+        if self.black_kings == (1 << 60):
+            castling += ('k' if self.black_rooks & (1 << 63) else '') + ('q' if self.black_rooks & (1 << 56) else '')
+
+        plies = len(self.move_history) + (1 if self.start_turn == 'black' else 0)
+        fullmove = self.start_fullmove + plies // 2
+        return f"{'/'.join(rows)} {'w' if self.turn == 'white' else 'b'} {castling or '-'} - 0 {fullmove}"
+
     # Notation
     def user_move(self):
         from_notation = input("Enter the starting position of the piece (e.g., 'e2'): ")
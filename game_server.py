@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from game_manager import GameManager, STARTING_FEN
+from move_generator import MoveGenerator
+from opening_book import OpeningBook
+from tablebase import Tablebase, MATE_SCORE
+from tournament import is_insufficient_material
+from uci import UCI_MOVE, move_to_uci
+
+# Protocol: one JSON object per line in each direction.
+#   {"type": "new", "white": "human"|"bot", "black": "human"|"bot", "fen": ..., "depth": 3, "time_limit": 2.0}
+#   {"type": "move", "move": "e2e4"}      a human move, long algebraic as in UCI
+#   {"type": "go"}                        ask the engine to move for the side to move
+#   {"type": "state"}
+# The server answers with "state", "move", "game_over" and "error" messages; bot moves are pushed as they are made,
+# with the engine's white-relative score in pawns.
+PLAYERS = ('human', 'bot')
+MAX_PLIES = 400
+
+_worker_generator = None
+
+
+def init_worker(book_path, tablebase_dir):
+    # Each worker process keeps one MoveGenerator, and its book and tables, for its whole life
+    global _worker_generator
+    _worker_generator = MoveGenerator(book=OpeningBook(book_path) if book_path else None,
+                                      tablebase=Tablebase(tablebase_dir) if tablebase_dir else None)
+
+
+def engine_move(task):
+    # Runs in a worker: deepen until the depth or the time limit, whichever comes first
+    fen, moves, depth, time_limit = task
+    move_generator = _worker_generator or MoveGenerator()
+    game_manager = GameManager()
+    game_manager.load_fen(fen)
+    for from_notation, to_notation in moves:
+        game_manager.make_move(from_notation, to_notation)
+    color = 1 if game_manager.turn == 'white' else -1
+
+    start = time.perf_counter()
+    deadline = start + time_limit
+    move_generator.nodes = 0
+    score, move, _, reached = move_generator.iterative_search(
+        game_manager, color, depth, lambda: time.perf_counter() >= deadline)
+    if move is None:
+        legal_moves = game_manager.get_legal_moves(game_manager.turn)
+        move = tuple(game_manager.pos_to_notation(pos) for pos in legal_moves[0]) if legal_moves else None
+    return {
+        'move': move,
+        # JSON has no infinity, so search mates are reported on the tablebase scale
+        'score': score if abs(score) != float('inf') else MATE_SCORE if score > 0 else -MATE_SCORE,
+        'depth': reached,
+        'nodes': move_generator.nodes,
+        'time': time.perf_counter() - start
+    }
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class FairScheduler:
+    """Shares a bounded process pool between sessions in round-robin order.
+
+    Every free worker takes the oldest request of the next session in the rotation, so a session
+    with many requests queued (a bot-vs-bot game, say) cannot starve the others.
+    """
+
+    def __init__(self, executor, workers, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.queues = {}  # session id -> deque of (task, timeout, future)
+        self.rotation = deque()
+        self.pending = 0
+        self.available = asyncio.Semaphore(0)
+        self.runners = [asyncio.ensure_future(self.run()) for _ in range(workers)]
+
+    def submit(self, session_id, task, timeout):
+        if self.pending >= self.max_pending:
+            raise ServerBusy(f"{self.pending} engine requests are already queued")
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.setdefault(session_id, deque())
+        if not queue:
+            self.rotation.append(session_id)
+        queue.append((task, timeout, future))
+        self.pending += 1
+        self.available.release()
+        return future
+
+    def cancel(self, session_id):
+        # Drop a departed session's queued requests; one already running is left to finish
+        for _, _, future in self.queues.pop(session_id, ()):
+            future.cancel()
+            self.pending -= 1
+        if session_id in self.rotation:
+            self.rotation.remove(session_id)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.available.acquire()
+            if not self.rotation:
+                continue  # the request was cancelled while queued
+            session_id = self.rotation.popleft()
+            queue = self.queues[session_id]
+            task, timeout, future = queue.popleft()
+            self.pending -= 1
+            if queue:
+                self.rotation.append(session_id)
+            else:
+                del self.queues[session_id]
+            try:
+                # The worker honours the time limit itself; the grace period only covers pickling and start-up
+                result = await asyncio.wait_for(loop.run_in_executor(self.executor, engine_move, task), timeout + 5)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def close(self):
+        for runner in self.runners:
+            runner.cancel()
+
+
+class Session:
+    """One game on one connection, with the GameManager that holds it."""
+
+    def __init__(self, session_id, scheduler, writer, default_depth, max_time):
+        self.session_id = session_id
+        self.scheduler = scheduler
+        self.writer = writer
+        self.default_depth = default_depth
+        self.max_time = max_time
+        self.game_manager = GameManager()
+        self.game_manager.setup_board()
+        self.players = {'white': 'human', 'black': 'bot'}
+        self.depth = default_depth
+        self.time_limit = max_time
+        self.fen = STARTING_FEN
+        self.moves = []
+        self.result = None
+        self.engine_task = None
+
+    def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode())
+
+    def state(self):
+        color = self.game_manager.turn
+        return {
+            'type': 'state',
+            'fen': self.game_manager.to_fen(),
+            'turn': color,
+            'players': self.players,
+            'moves': [from_notation + to_notation for from_notation, to_notation in self.moves],
+            'legal_moves': [] if self.result else self.legal_moves(),
+            'result': self.result
+        }
+
+    def legal_moves(self):
+        game_manager = self.game_manager
+        return [move_to_uci(game_manager, (game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos)))
+                for from_pos, to_pos in game_manager.get_legal_moves(game_manager.turn)]
+
+    async def handle(self, message):
+        if not isinstance(message, dict):
+            raise ValueError("messages must be JSON objects")
+        kind = message.get('type')
+        if kind == 'new':
+            self.new_game(message)
+            self.send(self.state())
+            self.start_engine_if_due()
+        elif kind == 'move':
+            self.human_move(message.get('move', ''))
+        elif kind == 'go':
+            if self.result is None and self.engine_task is None:
+                self.start_engine()
+        elif kind == 'state':
+            self.send(self.state())
+        else:
+            raise ValueError(f"unknown message type {kind!r}")
+
+    def new_game(self, message):
+        # Every field is checked before anything changes, so a rejected request leaves the current game running
+        players = {color: message.get(color, self.players[color]) for color in ('white', 'black')}
+        if any(player not in PLAYERS for player in players.values()):
+            raise ValueError(f"players must be one of {', '.join(PLAYERS)}")
+        try:
+            depth = min(int(message.get('depth', self.default_depth)), 64)
+            time_limit = min(float(message.get('time_limit', self.max_time)), self.max_time)
+        except OverflowError:
+            raise ValueError("depth and time_limit must be finite numbers")
+        if depth < 1 or not time_limit > 0:
+            raise ValueError("depth and time_limit must be positive")
+        fen = message.get('fen', STARTING_FEN)
+        if not isinstance(fen, str):
+            raise ValueError("fen must be a string")
+        game_manager = GameManager()
+        game_manager.load_fen(fen)
+
+        self.cancel_engine()
+        self.game_manager = game_manager
+        self.fen = fen
+        self.players = players
+        self.depth = depth
+        self.time_limit = time_limit
+        self.moves = []
+        self.result = None
+
+    def human_move(self, text):
+        if self.result is not None:
+            raise ValueError("the game is over")
+        color = self.game_manager.turn
+        if self.players[color] != 'human' or self.engine_task is not None:
+            raise ValueError("it is not a human's turn to move")
+        if not UCI_MOVE.fullmatch(text):
+            raise ValueError(f"cannot parse move {text!r}")
+        move = (self.game_manager.notation_to_pos(text[:2]), self.game_manager.notation_to_pos(text[2:4]))
+        if move not in self.game_manager.get_legal_moves(color):
+            raise ValueError(f"{text} is not a legal move")
+        self.play(text[:2], text[2:4], 'human')
+        self.start_engine_if_due()
+
+    def play(self, from_notation, to_notation, by, **details):
+        text = move_to_uci(self.game_manager, (from_notation, to_notation))
+        color = self.game_manager.turn
+        self.game_manager.make_move(from_notation, to_notation)
+        self.moves.append((from_notation, to_notation))
+        self.send(dict({'type': 'move', 'color': color, 'by': by, 'move': text, 'fen': self.game_manager.to_fen()}, **details))
+        self.check_game_over()
+
+    def check_game_over(self):
+        color = self.game_manager.turn
+        if not self.game_manager.get_legal_moves(color):
+            if self.game_manager.is_check(color):
+                self.result, reason = ('0-1' if color == 'white' else '1-0'), 'checkmate'
+            else:
+                self.result, reason = '1/2-1/2', 'stalemate'
+        elif is_insufficient_material(self.game_manager):
+            self.result, reason = '1/2-1/2', 'insufficient material'
+        elif len(self.moves) >= MAX_PLIES:
+            self.result, reason = '1/2-1/2', 'move limit'
+        else:
+            return
+        self.send({'type': 'game_over', 'result': self.result, 'reason': reason})
+
+    def start_engine_if_due(self):
+        if self.result is None and self.players[self.game_manager.turn] == 'bot':
+            self.start_engine()
+
+    def start_engine(self):
+        future = self.scheduler.submit(self.session_id, (self.fen, list(self.moves), self.depth, self.time_limit),
+                                       self.time_limit)
+        self.engine_task = asyncio.ensure_future(self.engine_reply(future))
+
+    async def engine_reply(self, future):
+        try:
+            result = await future
+        except asyncio.CancelledError:
+            return
+        except Exception as error:
+            self.engine_task = None
+            self.send({'type': 'error', 'message': f"engine request failed: {error}"})
+            return
+        self.engine_task = None
+        if result['move'] is None:
+            return
+        self.play(*result['move'], 'bot', score=result['score'], depth=result['depth'],
+                  nodes=result['nodes'], time=round(result['time'], 3))
+        await self.writer.drain()
+        # Bot-vs-bot games carry on by themselves; the scheduler keeps them from hogging the workers
+        self.start_engine_if_due()
+
+    def cancel_engine(self):
+        self.scheduler.cancel(self.session_id)
+        if self.engine_task is not None:
+            self.engine_task.cancel()
+            self.engine_task = None
+
+
+class GameServer:
+    def __init__(self, workers, max_pending, default_depth, max_time, book_path=None, tablebase_dir=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.default_depth = default_depth
+        self.max_time = max_time
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                            initargs=(book_path, tablebase_dir))
+        self.scheduler = None
+        self.session_ids = itertools.count(1)
+        self.sessions = {}
+
+    async def handle_connection(self, reader, writer):
+        session = Session(next(self.session_ids), self.scheduler, writer, self.default_depth, self.max_time)
+        self.sessions[session.session_id] = session
+        session.send(session.state())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    await session.handle(json.loads(line))
+                except (ValueError, TypeError, ServerBusy) as error:
+                    session.send({'type': 'error', 'message': str(error)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            session.cancel_engine()
+            del self.sessions[session.session_id]
+            writer.close()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=8765):
+        self.scheduler = FairScheduler(self.executor, self.workers, self.max_pending)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        address = socket_path or f"{host}:{port}"
+        print(f"Serving games on {address} with {self.workers} engine workers", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.scheduler.close()
+            self.executor.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many human-vs-bot and bot-vs-bot games over a local socket.")
+    parser.add_argument('--socket', default=None, help="Unix socket path; a TCP port on localhost is used otherwise")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="engine processes shared by all games")
+    parser.add_argument('--max-pending', type=int, default=1000, help="queued engine requests before new ones are refused")
+    parser.add_argument('--depth', type=int, default=3, help="default search depth")
+    parser.add_argument('--max-time', type=float, default=5.0, help="longest a single engine move may take, in seconds")
+    parser.add_argument('--book', default=None)
+    parser.add_argument('--tablebases', default=None)
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.workers, args.max_pending, args.depth, args.max_time, args.book, args.tablebases)
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,259 @@
-import multiprocessing
-import math
-import numpy as np
+import functools
+import queue
 import random
+import time
 from copy import deepcopy
+from game_manager import GameManager
+from search_stats import SearchStats
+
+class SearchAborted(Exception):
+    """Raised out of negamax when should_stop fires; moves made during the search are left on the board."""
+
+
+def recorded(search):
+    # Counts and times top-level searches into self.stats, and logs a JSON line after each, when enabled.
+    # The caller's GameManager is timed into the same stats for this search only, then put back as it was.
+    @functools.wraps(search)
+    def wrapper(self, game_manager, *args, **kwargs):
+        if self.stats is None:
+            return search(self, game_manager, *args, **kwargs)
+        previous_stats = game_manager.stats
+        if previous_stats is not self.stats:
+            game_manager.enable_stats(self.stats)
+        start = time.perf_counter()
+        try:
+            return search(self, game_manager, *args, **kwargs)
+        finally:
+            if previous_stats is None:
+                game_manager.disable_stats()
+            elif previous_stats is not self.stats:
+                game_manager.enable_stats(previous_stats)
+            self.stats.searches += 1
+            self.stats.search_time += time.perf_counter() - start
+            if self.stats_stream is not None:
+                self.stats.write_json_line(self.stats_stream, event=search.__name__)
+    return wrapper
+
 
 class MoveGenerator:
+    def __init__(self, book=None, tablebase=None, cache=None):
+        self.nodes = 0
+        self.book = book
+        self.tablebase = tablebase
+        self.cache = cache
+        # Optional callable polled at every node, e.g. for time or node limits
+        self.should_stop = None
+        # Best line found below each remaining depth, rebuilt as the search unwinds
+        self.pv_table = {}
+        # Worker processes kept by analyze_many between calls
+        self.pool = None
+        self.pool_processes = 0
+        # Opt-in SearchStats, see enable_stats
+        self.stats = None
+        self.stats_stream = None
+        # Shuffles move order so that equal moves are not always picked the same way
+        self.rng = random.Random()
+
+    def __getstate__(self):
+        # Workers never consult the book or the analysis cache, so they are not sent to them
+        state = self.__dict__.copy()
+        state['book'] = None
+        state['cache'] = None
+        state['should_stop'] = None
+        state['pool'] = None
+        state['stats_stream'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Every worker gets its own freshly seeded generator rather than a copy of the parent's
+        self.__dict__.update(state)
+        self.rng = random.Random()
+
+    def enable_stats(self, stream=None):
+        """Start collecting SearchStats, also written as a JSON line to stream after every search if given."""
+        self.stats = SearchStats()
+        self.stats_stream = stream
+        return self.stats
+
+    def disable_stats(self):
+        stats = self.stats
+        self.stats = None
+        self.stats_stream = None
+        return stats
+
+    def probe_book(self, game_manager):
+        if self.book is None:
+            return None
+        book_move = self.book.probe(game_manager)
+        if book_move is None:
+            return None
+        return 0, tuple(game_manager.pos_to_notation(pos) for pos in book_move)
+
+    def probe_tablebase_root(self, game_manager):
+        if self.tablebase is None:
+            return None
+        return self.tablebase.best_move(game_manager)
+
+    def probe_cache(self, game_manager, depth):
+        # A result from an earlier search at least this deep, from this or a previous session
+        if self.cache is None:
+            return None
+        cached = self.cache.get(game_manager.zobrist_hash(), depth)
+        if self.stats is not None:
+            self.stats.add_probe('analysis_cache', cached is not None)
+        if cached is None:
+            return None
+        _, score, move = cached
+        return score, move and tuple(game_manager.pos_to_notation(pos) for pos in move)
+
+    def store_cache(self, game_manager, depth, result):
+        if self.cache is None:
+            return
+        score, move = result
+        move = move and tuple(game_manager.notation_to_pos(square) for square in move)
+        self.cache.put(game_manager.zobrist_hash(), depth, score, move)
+
+    def principal_variation(self, depth, best_move):
+        # The line behind the last search's best move, or just the move when it came from a book, table or cache
+        pv = self.pv_table.get(depth, [])
+        return pv if pv[:1] == [best_move] else [best_move] if best_move else []
+
+    @recorded
+    def search(self, game_manager, color, depth=None, movetime=None):
+        # Single-process search, for callers that are already running inside a worker.
+        # With movetime (seconds) it deepens until the next iteration would not fit in the budget.
+        self.pv_table = {}
+        book_result = self.probe_book(game_manager) or self.probe_tablebase_root(game_manager)
+        if book_result is not None:
+            return book_result
+
+        text_color = 'black' if color == -1 else 'white'
+        all_possible_moves = game_manager.get_all_moves(text_color)
+        max_depth = depth if depth is not None else 64
+        start_depth = max_depth if movetime is None else 1
+
+        start_time = time.perf_counter()
+        result = (-float('inf') if color == 1 else float('inf'), None)
+        for current_depth in range(start_depth, max_depth + 1):
+            iteration_start = time.perf_counter()
+            cached = self.probe_cache(game_manager, current_depth)
+            if cached is not None:
+                result = cached
+                continue  # cached iterations cost nothing, so they say nothing about the time budget
+            result = self.process_chunk((game_manager, current_depth, -float('inf'), float('inf'), color, all_possible_moves))
+            self.store_cache(game_manager, current_depth, result)
+            if movetime is None:
+                break
+            now = time.perf_counter()
+            # Each extra ply costs several times the last one
+            if (now - start_time) + 4 * (now - iteration_start) > movetime:
+                break
+        return result
+
+    def iterative_search(self, game_manager, color, max_depth=64, should_stop=None, on_iteration=None):
+        """Deepen one ply at a time until max_depth, a mate, or should_stop() fires part way through an iteration.
+
+        Returns (score, move, pv, depth) of the deepest finished iteration; depth is 0 for book and tablebase
+        moves, and move is None if nothing finished. on_iteration is called with the same tuple as each one ends.
+        """
+        known = self.probe_book(game_manager) or self.probe_tablebase_root(game_manager)
+        if known is not None:
+            result = (known[0], known[1], [known[1]], 0)
+            if on_iteration is not None:
+                on_iteration(*result)
+            return result
+
+        result = (0, None, [], 0)
+        history_length = len(game_manager.move_history)
+        self.should_stop = should_stop
+        try:
+            for depth in range(1, max_depth + 1):
+                try:
+                    score, move = self.search(game_manager, color, depth=depth)
+                except SearchAborted:
+                    # Take back the moves the interrupted iteration left on the board
+                    while len(game_manager.move_history) > history_length:
+                        game_manager.undo_move()
+                    break
+                if move is None:
+                    break  # no legal moves
+                result = (score, move, self.principal_variation(depth, move), depth)
+                if on_iteration is not None:
+                    on_iteration(*result)
+                if abs(score) == float('inf'):
+                    break  # the shallowest mate is found first
+        finally:
+            self.should_stop = None
+        return result
+
+    def analyze_many(self, positions, limits=None, processes=None, max_pending=None):
+        """Analyse FEN strings or GameManagers across a persistent worker pool, yielding results as they finish.
+
+        limits may set depth (2 when nothing else is set), movetime (seconds) and nodes for each position.
+        Only max_pending positions (two per worker by default) are taken from positions ahead of the consumer,
+        so neither the input nor the results need to fit in memory. Each result is a dict with index, fen,
+        score (white-relative), best_move, pv, depth, nodes and time.
+        """
+        import multiprocessing  # only bulk analysis and parallel_search need worker processes
+        limits = limits or {}
+        processes = processes or multiprocessing.cpu_count()
+        if self.pool is None or self.pool_processes != processes:
+            self.close()
+            self.pool = multiprocessing.Pool(processes=processes, initializer=init_analysis_worker, initargs=(self,))
+            self.pool_processes = processes
+        max_pending = max_pending or processes * 2
+
+        finished = queue.Queue()
+        positions = enumerate(positions)
+        pending = 0
+        exhausted = False
+        last_result = time.perf_counter()
+        while True:
+            while not exhausted and pending < max_pending:
+                try:
+                    index, position = next(positions)
+                except StopIteration:
+                    exhausted = True
+                    break
+                # Whether to collect stats travels with each task, since the workers' copy of self is never updated
+                self.pool.apply_async(analyze_position, ((index, position, limits, self.stats is not None),),
+                                      callback=finished.put, error_callback=finished.put)
+                pending += 1
+            if pending == 0:
+                return
+            result = finished.get()
+            pending -= 1
+            if isinstance(result, BaseException):
+                raise result
+            worker_stats = result.pop('stats', None)
+            if worker_stats is not None and self.stats is not None:
+                self.stats.merge(worker_stats)
+                now = time.perf_counter()
+                self.stats.search_time += now - last_result
+                last_result = now
+                if self.stats_stream is not None:
+                    self.stats.write_json_line(self.stats_stream, event='analyze_many', index=result['index'])
+            yield result
+
+    def close(self):
+        # Stops the analyze_many workers; the next call starts fresh ones
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.pool_processes = 0
+
+    @recorded
     def parallel_search(self, game_manager, depth, color, num_processes):
+        # Book and tablebase moves are played without starting any worker processes
+        book_result = self.probe_book(game_manager) or self.probe_tablebase_root(game_manager)
+        if book_result is not None:
+            return book_result
+        cached = self.probe_cache(game_manager, depth)
+        if cached is not None:
+            return cached
+
+        import multiprocessing
         with multiprocessing.Pool(processes=num_processes) as pool:
             alpha = -float('inf')
             beta = float('inf')
@@ -28,7 +276,13 @@ class MoveGenerator:
                 tasks.append((game_manager, depth, alpha, beta, color, partial_moves))
                 start = end
     
-            results = pool.map(self.process_chunk, tasks)
+            if self.stats is None:
+                results = pool.map(self.process_chunk, tasks)
+            else:
+                results = []
+                for eval, move, worker_stats in pool.map(self.process_chunk_with_stats, tasks):
+                    self.stats.merge(worker_stats)
+                    results.append((eval, move))
     
             best_move = None
             if text_color == 'white':
@@ -43,11 +297,20 @@ class MoveGenerator:
                     if eval < max_eval:
                         max_eval = eval
                         best_move = move
+            self.store_cache(game_manager, depth, (max_eval, best_move))
             return max_eval, best_move
 
+    def process_chunk_with_stats(self, args):
+        # Runs in a parallel_search worker, which collects into its own SearchStats for the parent to merge
+        self.stats = SearchStats()
+        args[0].enable_stats(self.stats)
+        return self.process_chunk(args) + (self.stats,)
+
     def process_chunk(self, args):
         game_manager, depth, alpha, beta, color, moves = args
         best_move = None
+        self.pv_table[depth] = []
+        nodes = self.nodes
         text_color = 'black' if color == -1 else 'white'
         if text_color == 'white':
             max_eval = float('-inf')
@@ -69,6 +332,7 @@ class MoveGenerator:
                     if eval > max_eval:
                         max_eval = eval
                         best_move = (start_notation, end_notation)
+                        self.pv_table[depth] = [best_move] + self.pv_table.get(depth - 1, [])
                     alpha = max(alpha, eval)
                     if alpha >= beta:
                         break
@@ -76,13 +340,29 @@ class MoveGenerator:
                     if eval < max_eval:
                         max_eval = eval
                         best_move = (start_notation, end_notation)
+                        self.pv_table[depth] = [best_move] + self.pv_table.get(depth - 1, [])
                     beta = min(beta, eval)
                     if beta <= alpha:
                         break
+        if self.stats is not None:
+            self.stats.nodes += self.nodes - nodes
+            self.stats.add_depth_nodes(depth, self.nodes - nodes)
         return (max_eval, best_move)
             
 
     def negamax(self, game_manager, depth, alpha, beta, color):
+        self.nodes += 1
+        self.pv_table[depth] = []
+        if self.should_stop is not None and self.should_stop():
+            raise SearchAborted()
+        # Small endings are looked up instead of searched
+        if self.tablebase is not None:
+            tablebase_score = self.tablebase.score(game_manager)
+            if self.stats is not None:
+                self.stats.add_probe('tablebase', tablebase_score is not None)
+            if tablebase_score is not None:
+                return tablebase_score, None
+
         # Check for game over conditions
         text_color = 'black' if color == -1 else 'white'
     
@@ -93,10 +373,8 @@ class MoveGenerator:
             evaluation = color * game_manager.evaluate_board(text_color)
             return evaluation, None
     
-        rng = np.random.default_rng()
         all_possible_moves = game_manager.get_all_moves(text_color)
-        random.seed(math.pow(len(all_possible_moves), rng.integers(low=0, high=100)))
-        random.shuffle(all_possible_moves)
+        self.rng.shuffle(all_possible_moves)
     
         if not all_possible_moves:
             evaluation = color * game_manager.evaluate_board()
@@ -107,6 +385,7 @@ class MoveGenerator:
         else:
             max_eval = float('inf')
         best_move = None
+        first_eval = None
     
         for start_pos, valid_moves in all_possible_moves:
             start_notation = game_manager.pos_to_notation(start_pos)
@@ -129,16 +408,73 @@ class MoveGenerator:
                 
                 eval, _ = self.negamax(game_manager, depth - 1, -beta, -alpha, -color)
                 game_manager.undo_move()
+                if first_eval is None:
+                    first_eval = eval
     
                 if text_color == 'white':
                     if eval > max_eval:
                         max_eval = eval
                         best_move = (start_notation, end_notation)
+                        self.pv_table[depth] = [best_move] + self.pv_table.get(depth - 1, [])
                     alpha = max(alpha, eval)
                 else:
                     if eval < max_eval:
                         max_eval = eval
                         best_move = (start_notation, end_notation)
+                        self.pv_table[depth] = [best_move] + self.pv_table.get(depth - 1, [])
                     beta = min(beta, eval)
     
-        return max_eval, best_move
\ No newline at end of file
+        if self.stats is not None and first_eval is not None:
+            # White only raises alpha and black only lowers beta, so the bound each side fails against is unchanged
+            if text_color == 'white':
+                self.stats.add_node(max_eval >= beta, first_eval >= beta)
+            else:
+                self.stats.add_node(max_eval <= alpha, first_eval <= alpha)
+        return max_eval, best_move
+
+
+_analysis_generator = None
+
+
+def init_analysis_worker(move_generator):
+    # Each analyze_many worker keeps its own copy of the generator, and its tables, for the life of the pool
+    global _analysis_generator
+    _analysis_generator = move_generator
+
+
+def analyze_position(task):
+    index, position, limits, collect_stats = task
+    if isinstance(position, str):
+        game_manager = GameManager()
+        game_manager.load_fen(position)
+    else:
+        game_manager = position
+    move_generator = _analysis_generator or MoveGenerator()
+    move_generator.stats = SearchStats() if collect_stats else None
+    color = 1 if game_manager.turn == 'white' else -1
+
+    start = time.perf_counter()
+    deadline = start + limits['movetime'] if limits.get('movetime') else None
+    node_limit = limits.get('nodes')
+
+    def should_stop():
+        return (deadline is not None and time.perf_counter() >= deadline
+                or node_limit is not None and move_generator.nodes >= node_limit)
+
+    move_generator.nodes = 0
+    # Without a time or node limit the depth must stop the search
+    max_depth = limits.get('depth', 64 if deadline or node_limit else 2)
+    score, best_move, pv, depth = move_generator.iterative_search(game_manager, color, max_depth, should_stop)
+    result = {
+        'index': index,
+        'fen': game_manager.to_fen(),
+        'score': score,
+        'best_move': best_move,
+        'pv': pv,
+        'depth': depth,
+        'nodes': move_generator.nodes,
+        'time': time.perf_counter() - start
+    }
+    if move_generator.stats is not None:
+        result['stats'] = move_generator.stats
+    return result
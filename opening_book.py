@@ -0,0 +1,123 @@
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from game_archive import encode_move, decode_move
+from pgn import open_pgn, read_games, replay_game
+
+# File layout: magic, entry count, then (position hash, move, weight) entries sorted by hash
+MAGIC = b'CHSBOOK1'
+HEADER = struct.Struct('<8sQ')
+ENTRY = struct.Struct('<QHH')
+MAX_WEIGHT = 0xFFFF
+
+
+def build_book(pgn_paths, output_path, max_plies=16, min_weight=1):
+    """Turn PGN games into a book file; a move earns 2 points per win, 1 per draw or unknown result."""
+    weights = {}
+    games = 0
+    for path in pgn_paths:
+        with open_pgn(path) as pgn_file:
+            for headers, movetext in read_games(pgn_file):
+                result = headers.get('Result', '*')
+                key = turn = None
+                try:
+                    for ply, game_manager in enumerate(replay_game(headers, movetext)):
+                        if ply > 0:
+                            last_move = game_manager.move_history[-1]
+                            move = encode_move(last_move['from_pos'], last_move['to_pos'])
+                            winner = {'1-0': 'white', '0-1': 'black'}.get(result)
+                            points = 2 if winner == turn else 0 if winner else 1
+                            weights[(key, move)] = weights.get((key, move), 0) + points
+                        if ply >= max_plies:
+                            break
+                        key, turn = game_manager.zobrist_hash(), game_manager.turn
+                except ValueError:
+                    pass  # Keep the moves before the first one the engine cannot play
+                games += 1
+
+    entries = sorted((key, move, min(weight, MAX_WEIGHT)) for (key, move), weight in weights.items()
+                     if weight >= min_weight)
+    with open(output_path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, len(entries)))
+        for entry in entries:
+            book_file.write(ENTRY.pack(*entry))
+    return games, len(entries)
+
+
+class OpeningBook:
+    """Memory-mapped book lookups: a binary search over the sorted entries, no loading step."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rng = random.Random()
+        with open(path, 'rb') as book_file:
+            self.mmap = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+
+    def __getstate__(self):
+        # Worker processes reopen the file rather than receiving the mapping
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _key_at(self, index):
+        return struct.unpack_from('<Q', self.mmap, HEADER.size + index * ENTRY.size)[0]
+
+    def entries(self, key):
+        # Lower bound of key, then every entry that shares it
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count:
+            entry_key, move, weight = ENTRY.unpack_from(self.mmap, HEADER.size + low * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((decode_move(move), weight))
+            low += 1
+        return found
+
+    def probe(self, game_manager, best=False):
+        """A weighted-random book move (from_pos, to_pos) for the side to move, or None when out of book."""
+        entries = [(move, weight) for move, weight in self.entries(game_manager.zobrist_hash()) if weight > 0]
+        if not entries:
+            return None
+        # Guard against hash collisions by only playing moves that are legal here
+        legal_moves = game_manager.get_legal_moves(game_manager.turn)
+        entries = [(move, weight) for move, weight in entries if move in legal_moves]
+        if not entries:
+            return None
+        if best:
+            return max(entries, key=lambda entry: entry[1])[0]
+        moves, weights = zip(*entries)
+        return self.rng.choices(moves, weights=weights)[0]
+
+    def close(self):
+        self.mmap.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an opening book from PGN games.")
+    parser.add_argument('pgn', nargs='+', help="PGN files (.pgn, .pgn.gz or .pgn.bz2)")
+    parser.add_argument('-o', '--output', default='book.bin')
+    parser.add_argument('--max-plies', type=int, default=16, help="only book the first plies of each game")
+    parser.add_argument('--min-weight', type=int, default=2, help="drop moves with fewer points than this")
+    args = parser.parse_args(argv)
+
+    games, entries = build_book(args.pgn, args.output, args.max_plies, args.min_weight)
+    print(f"Wrote {entries} entries from {games} games to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+from collections import OrderedDict, namedtuple
+
+# White-relative pawn terms, except blocks and king_exposure which are the same for both sides
+PawnEntry = namedtuple('PawnEntry', ['structure', 'chains', 'blocks', 'king_shield', 'king_exposure'])
+
+
+class PawnHashTable:
+    """Bounded LRU cache of pawn-structure scores keyed on the pawn bitboards and king squares."""
+
+    def __init__(self, max_entries=16384):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
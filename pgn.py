@@ -0,0 +1,226 @@
+import bz2
+import gzip
+import re
+from collections import deque
+
+from game_manager import GameManager
+
+PIECE_LETTERS = {'pawns': '', 'knights': 'N', 'bishops': 'B', 'rooks': 'R', 'queens': 'Q', 'kings': 'K'}
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+
+
+def move_to_san(game_manager, from_pos, to_pos, legal_moves=None):
+    """Standard algebraic notation for a legal move of the side to move, e.g. 'Nbd2', 'exd5', 'e8=Q+', 'O-O'."""
+    piece, color = game_manager.get_piece_at_position(from_pos)
+    if legal_moves is None:
+        legal_moves = game_manager.get_legal_moves(color)
+    target_piece, _ = game_manager.get_piece_at_position(to_pos)
+
+    if piece == 'kings' and abs(to_pos - from_pos) == 2:
+        san = 'O-O' if to_pos > from_pos else 'O-O-O'
+    elif piece == 'pawns':
+        san = game_manager.pos_to_notation(to_pos)
+        if target_piece:
+            san = game_manager.pos_to_notation(from_pos)[0] + 'x' + san
+        if game_manager.is_pawn_promotion(to_pos, color):
+            san += '=Q'
+    else:
+        # Disambiguate between pieces of the same type that can reach the same square
+        rivals = [other for other, target in legal_moves
+                  if target == to_pos and other != from_pos and game_manager.get_piece_at_position(other)[0] == piece]
+        from_notation = game_manager.pos_to_notation(from_pos)
+        disambiguation = ''
+        if rivals:
+            if all(other % 8 != from_pos % 8 for other in rivals):
+                disambiguation = from_notation[0]
+            elif all(other // 8 != from_pos // 8 for other in rivals):
+                disambiguation = from_notation[1]
+            else:
+                disambiguation = from_notation
+        san = PIECE_LETTERS[piece] + disambiguation + ('x' if target_piece else '') + game_manager.pos_to_notation(to_pos)
+
+    # Check and mate markers
+    opponent = 'black' if color == 'white' else 'white'
+    game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+    if game_manager.is_check(opponent):
+        san += '#' if not game_manager.get_legal_moves(opponent) else '+'
+    game_manager.undo_move()
+    return san
+
+
+def format_pgn(headers, sans, result='*', line_width=80):
+    # Seven tag roster first, then any extra tags in the order given
+    roster = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+    tags = dict.fromkeys(roster, '?')
+    tags.update(headers)
+    tags['Result'] = result
+    lines = [f'[{name} "{tags[name]}"]' for name in roster]
+    lines += [f'[{name} "{value}"]' for name, value in tags.items() if name not in roster]
+    lines.append('')
+
+    tokens = []
+    for ply, san in enumerate(sans):
+        if ply % 2 == 0:
+            tokens.append(f'{ply // 2 + 1}.')
+        tokens.append(san)
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > line_width:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+# Reading
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+PIECE_FROM_LETTER = {letter: piece for piece, letter in PIECE_LETTERS.items() if letter}
+MOVE_NUMBER = re.compile(r'\d+\.+')
+
+
+def open_pgn(path):
+    # Plain, gzip or bz2 archives, read as a text stream
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def read_games(lines):
+    """Yield (headers, movetext) for each game in an iterable of PGN lines, one game in memory at a time."""
+    headers = {}
+    movetext = []
+    comment_depth = 0
+    # A blank line ends the header block, so that a game with headers and no moves is still a game of its own
+    headers_closed = False
+    for line in lines:
+        stripped = line.strip()
+        if comment_depth == 0 and stripped.startswith('['):
+            if movetext or headers_closed:
+                yield headers, '\n'.join(movetext)
+                headers, movetext, headers_closed = {}, [], False
+            match = re.match(r'\[(\w+)\s+"(.*)"\]', stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif not stripped:
+            headers_closed = bool(headers)
+        elif not stripped.startswith('%'):
+            # Lines stay separate, since a ';' comment runs to the end of its line only
+            movetext.append(stripped)
+            comment_depth = max(comment_depth + stripped.count('{') - stripped.count('}'), 0)
+    if headers or movetext:
+        yield headers, '\n'.join(movetext)
+
+
+def tokenize_movetext(movetext):
+    # SAN tokens only: comments, variations, NAGs, move numbers and the result are dropped
+    movetext = re.sub(r'\{[^}]*\}', ' ', movetext)
+    movetext = re.sub(r';[^\n]*', ' ', movetext)
+    while '(' in movetext:
+        stripped = re.sub(r'\([^()]*\)', ' ', movetext)
+        if stripped == movetext:
+            break
+        movetext = stripped
+    movetext = MOVE_NUMBER.sub(' ', movetext)
+    for token in movetext.split():
+        if token.startswith('$') or token in RESULTS:
+            continue
+        yield token
+
+
+def san_to_move(game_manager, san, legal_moves=None):
+    """Resolve a SAN move for the side to move into (from_pos, to_pos); raises ValueError if it is not playable here."""
+    color = game_manager.turn
+    text = san.rstrip('+#!?').replace('0', 'O')
+    if text in ('O-O', 'O-O-O'):
+        king_pos = game_manager.find_king(color)
+        candidates = [(king_pos, king_pos + (2 if text == 'O-O' else -2))]
+        piece = 'kings'
+    else:
+        match = SAN_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Cannot parse SAN move '{san}'")
+        letter, from_file, from_rank, destination, promotion = match.groups()
+        if promotion and promotion != 'Q':
+            raise ValueError(f"Underpromotion '{san}' is not supported; pawns always promote to queens")
+        piece = PIECE_FROM_LETTER[letter] if letter else 'pawns'
+        to_pos = game_manager.notation_to_pos(destination)
+        board = getattr(game_manager, f"{color}_{piece}")
+        candidates = []
+        while board:
+            from_pos = (board & -board).bit_length() - 1
+            board &= board - 1
+            from_notation = game_manager.pos_to_notation(from_pos)
+            if from_file and from_notation[0] != from_file or from_rank and from_notation[1] != from_rank:
+                continue
+            if to_pos in game_manager.get_piece_moves(from_pos, piece, color):
+                candidates.append((from_pos, to_pos))
+
+    if piece == 'kings' or len(candidates) > 1:
+        # Only pay for the legality test when it decides something
+        if legal_moves is None:
+            legal_moves = game_manager.get_legal_moves(color)
+        candidates = [move for move in candidates if move in legal_moves]
+    if len(candidates) != 1:
+        reason = 'ambiguous' if candidates else 'not a legal move'
+        raise ValueError(f"SAN move '{san}' is {reason} for {color} in {game_manager.to_fen()}")
+    return candidates[0]
+
+
+def replay_game(headers, movetext, game_manager=None):
+    """Yield the game manager after the starting position and after every move of one game.
+
+    The same GameManager is updated in place, so copy anything that must outlive the next step.
+    Raises ValueError at the first move the engine cannot play.
+    """
+    game_manager = game_manager or GameManager()
+    if 'FEN' in headers:
+        game_manager.load_fen(headers['FEN'])
+    else:
+        game_manager.setup_board()
+    yield game_manager
+    for san in tokenize_movetext(movetext):
+        from_pos, to_pos = san_to_move(game_manager, san)
+        game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+        yield game_manager
+
+
+def iter_positions(path, errors=None):
+    """Stream (game_index, headers, ply, game_manager) for every position of every game in a PGN file.
+
+    Games stop at the first move the engine cannot play (en passant, underpromotion, corrupt text);
+    the error is appended to errors as (game_index, message) when a list is given.
+    """
+    game_manager = GameManager()
+    with open_pgn(path) as pgn_file:
+        for game_index, (headers, movetext) in enumerate(read_games(pgn_file)):
+            try:
+                for ply, position in enumerate(replay_game(headers, movetext, game_manager)):
+                    yield game_index, headers, ply, position
+            except ValueError as error:
+                if errors is not None:
+                    errors.append((game_index, str(error)))
+
+
+def map_games(path, func, processes=None, max_pending=None):
+    """Apply func(headers, movetext) to every game across a process pool, yielding results in file order.
+
+    At most max_pending games are read ahead of the consumer, so memory stays bounded on large archives.
+    func must be a module-level function so that it can be sent to the workers.
+    """
+    import multiprocessing  # reading and writing PGN never needs worker processes
+    processes = processes or multiprocessing.cpu_count()
+    max_pending = max_pending or processes * 4
+    pending = deque()
+    with open_pgn(path) as pgn_file, multiprocessing.Pool(processes=processes) as pool:
+        for headers, movetext in read_games(pgn_file):
+            pending.append(pool.apply_async(func, (headers, movetext)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
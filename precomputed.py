@@ -0,0 +1,157 @@
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+# Lookup tables that are costly to rebuild at every start-up, kept in one binary file and mapped on first use.
+# File layout: header (magic, format version, table count), a directory of (name, offset, length) entries,
+# then each table as little-endian uint64 values. Bump VERSION whenever a generator below changes.
+MAGIC = b'CHSTBLS\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+DIRECTORY_ENTRY = struct.Struct('<16sQQ')
+CACHE_PATH = os.environ.get('CHESS_PRECOMPUTED', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'precomputed.bin'))
+
+# Fixed seed so that hashes, and every file keyed by them, are stable across runs and machines
+ZOBRIST_SEED = 0x3100C0DE
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def generate_zobrist():
+    # 12 x 64 piece keys in BITBOARD_NAMES order, then the black-to-move key, drawn in that order
+    rng = random.Random(ZOBRIST_SEED)
+    return [rng.getrandbits(64) for _ in range(12 * 64 + 1)]
+
+
+def _step_masks(offsets):
+    masks = []
+    for pos in range(64):
+        mask = 0
+        for rank_step, file_step in offsets:
+            rank, file = pos // 8 + rank_step, pos % 8 + file_step
+            if 0 <= rank < 8 and 0 <= file < 8:
+                mask |= 1 << (rank * 8 + file)
+        masks.append(mask)
+    return masks
+
+
+def generate_knight_masks():
+    return _step_masks(KNIGHT_OFFSETS)
+
+
+def generate_king_masks():
+    # Plain king steps; castling depends on the position and is left to GameManager.king_moves
+    return _step_masks(KING_OFFSETS)
+
+
+def generate_shield_masks():
+    # Pawn squares that count as a shield for each king square, plus index 64 for a missing king (-1),
+    # derived from GameManager.has_pawn_shield itself so that the two can never disagree
+    from game_manager import GameManager
+    game_manager = GameManager()
+    masks = []
+    for king_pos in list(range(64)) + [-1]:
+        mask = 0
+        for pos in range(64):
+            game_manager.white_pawns = 1 << pos
+            if game_manager.has_pawn_shield(king_pos, 'white'):
+                mask |= 1 << pos
+        masks.append(mask)
+    return masks
+
+
+GENERATORS = {
+    'zobrist': generate_zobrist,
+    'knight_masks': generate_knight_masks,
+    'king_masks': generate_king_masks,
+    'shield_masks': generate_shield_masks
+}
+
+_tables = {}
+
+
+def _open_cache():
+    # The mapped file as {name: uint64 sequence}, or {} when it is missing, stale or unreadable.
+    # The memoryviews keep the mapping open for as long as they are in use.
+    try:
+        with open(CACHE_PATH, 'rb') as cache_file:
+            mapping = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return {}
+    try:
+        magic, version, count = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            return {}
+        tables = {}
+        for index in range(count):
+            name, offset, length = DIRECTORY_ENTRY.unpack_from(mapping, HEADER.size + index * DIRECTORY_ENTRY.size)
+            if offset + 8 * length > len(mapping):
+                return {}
+            if sys.byteorder == 'little':
+                tables[name.rstrip(b'\x00').decode('ascii')] = memoryview(mapping)[offset:offset + 8 * length].cast('Q')
+            else:
+                values = array('Q', mapping[offset:offset + 8 * length])
+                values.byteswap()
+                tables[name.rstrip(b'\x00').decode('ascii')] = values
+    except struct.error:
+        return {}
+    return tables
+
+
+def _write_cache(tables):
+    # Written beside the old file and swapped in, so a reader never sees half a file
+    directory = []
+    offset = HEADER.size + len(tables) * DIRECTORY_ENTRY.size
+    for name, values in tables.items():
+        directory.append(DIRECTORY_ENTRY.pack(name.encode('ascii'), offset, len(values)))
+        offset += 8 * len(values)
+    temporary_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as cache_file:
+        cache_file.write(HEADER.pack(MAGIC, VERSION, len(tables)))
+        cache_file.write(b''.join(directory))
+        for values in tables.values():
+            cache_file.write(struct.pack(f'<{len(values)}Q', *values))
+    os.replace(temporary_path, CACHE_PATH)
+
+
+def table(name):
+    """The named table as a sequence of ints, from the cache file when it is current and generated otherwise."""
+    if name in _tables:
+        return _tables[name]
+    if not _tables:
+        _tables.update(_open_cache())
+        if name in _tables:
+            return _tables[name]
+    values = GENERATORS[name]()
+    cached = {table_name: list(values) for table_name, values in _tables.items()}
+    cached[name] = values
+    try:
+        _write_cache(cached)
+    except OSError:
+        pass  # a read-only install still works, it just regenerates at every start
+    _tables[name] = values
+    return values
+
+
+def squares(mask):
+    targets = []
+    while mask:
+        targets.append((mask & -mask).bit_length() - 1)
+        mask &= mask - 1
+    return targets
+
+
+def main():
+    # Rebuild every table, e.g. after an install or a VERSION bump
+    for name in GENERATORS:
+        _tables[name] = GENERATORS[name]()
+    _write_cache(dict(_tables))
+    print(f"Wrote {', '.join(GENERATORS)} to {CACHE_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import json
+import time
+
+
+class SearchStats:
+    """Counters and timers collected while searching, when a MoveGenerator or GameManager has them enabled.
+
+    Times are inclusive: evaluate_board contains its terms, and is_check may contain move generation.
+    Worker processes collect their own SearchStats, which the parent folds in with merge().
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.nodes_per_depth = {}
+        self.searches = 0
+        self.search_time = 0.0
+        # Interior nodes that searched moves, those that failed high, and those where the first move did it
+        self.interior_nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.times = {}
+        self.calls = {}
+        self.cache_hits = {}
+        self.cache_probes = {}
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add_probe(self, cache, hit):
+        self.cache_probes[cache] = self.cache_probes.get(cache, 0) + 1
+        self.cache_hits[cache] = self.cache_hits.get(cache, 0) + hit
+
+    def add_depth_nodes(self, depth, nodes):
+        self.nodes_per_depth[depth] = self.nodes_per_depth.get(depth, 0) + nodes
+
+    def add_node(self, cutoff, first_move_cutoff):
+        self.interior_nodes += 1
+        self.cutoffs += cutoff
+        self.first_move_cutoffs += first_move_cutoff
+
+    def merge(self, other):
+        # Wall-clock search time stays the caller's own; workers run inside it
+        self.nodes += other.nodes
+        self.searches += other.searches
+        self.interior_nodes += other.interior_nodes
+        self.cutoffs += other.cutoffs
+        self.first_move_cutoffs += other.first_move_cutoffs
+        for depth, nodes in other.nodes_per_depth.items():
+            self.add_depth_nodes(depth, nodes)
+        for name, seconds in other.times.items():
+            self.times[name] = self.times.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.calls[name]
+        for cache, probes in other.cache_probes.items():
+            self.cache_probes[cache] = self.cache_probes.get(cache, 0) + probes
+            self.cache_hits[cache] = self.cache_hits.get(cache, 0) + other.cache_hits[cache]
+        return self
+
+    def as_dict(self):
+        return {
+            'searches': self.searches,
+            'nodes': self.nodes,
+            'search_time': self.search_time,
+            'nps': self.nodes / self.search_time if self.search_time else 0.0,
+            'nodes_per_depth': {str(depth): nodes for depth, nodes in sorted(self.nodes_per_depth.items())},
+            'interior_nodes': self.interior_nodes,
+            'cutoffs': self.cutoffs,
+            'cutoff_rate': self.cutoffs / self.interior_nodes if self.interior_nodes else 0.0,
+            'first_move_cutoff_pct': 100 * self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            'times': {name: {'seconds': seconds, 'calls': self.calls[name]} for name, seconds in sorted(self.times.items())},
+            'cache_hit_rates': {cache: self.cache_hits[cache] / probes for cache, probes in sorted(self.cache_probes.items())}
+        }
+
+    def to_json(self, **extra):
+        # One line, so that a log of searches can be read back with one json.loads per line
+        return json.dumps(dict(self.as_dict(), time=time.time(), **extra))
+
+    def write_json_line(self, stream, **extra):
+        stream.write(self.to_json(**extra) + '\n')
+        stream.flush()
@@ -0,0 +1,470 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from game_manager import GameManager, BITBOARD_NAMES
+from precomputed import table, squares
+
+# File layout: magic, material signature (8 bytes, space padded), then one signed byte per index.
+# index = (((square of piece 0) * 64 + square of piece 1) * 64 + ...) * 2 + (1 if black to move else 0)
+# A byte v > 0 means the side to move mates in v moves, v < 0 that it is mated in -v - 1 moves, 0 a draw.
+MAGIC = b'CHSTB\x00\x00\x01'
+HEADER = struct.Struct('<8s8s')
+PIECE_ORDER = 'KQRBNP'
+PIECE_COLUMNS = {'K': 5, 'Q': 4, 'R': 1, 'B': 3, 'N': 2, 'P': 0}  # bitboard columns for white pieces
+PIECE_STRENGTH = {'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+MATE_SCORE = 100000
+# Generation visits all 2 * 64**n indices in Python and takes about ten minutes for KQK.
+# A 4-piece table has 64 times as many indices, so generation stops at 3 pieces; probing reads any table file.
+MAX_GENERATED_PIECES = 3
+
+
+def win_value(plies):
+    return (plies + 1) // 2
+
+
+def loss_value(plies):
+    return -(plies // 2) - 1
+
+
+def value_plies(value):
+    # Plies to mate for a non-draw value
+    return 2 * value - 1 if value > 0 else 2 * (-value - 1)
+
+
+def parse_signature(signature):
+    # 'KQK' -> ('Q', ''), pieces sorted strongest first on each side
+    if signature.count('K') != 2 or not signature.startswith('K'):
+        raise ValueError(f"Material signature '{signature}' must look like 'KQK' or 'KPK'")
+    white, black = signature[1:].split('K')
+    if any(piece not in PIECE_ORDER[1:] for piece in white + black):
+        raise ValueError(f"Material signature '{signature}' has unknown pieces")
+    return ''.join(sorted(white, key=PIECE_ORDER.index)), ''.join(sorted(black, key=PIECE_ORDER.index))
+
+
+def make_signature(white, black):
+    return 'K' + ''.join(sorted(white, key=PIECE_ORDER.index)) + 'K' + ''.join(sorted(black, key=PIECE_ORDER.index))
+
+
+def canonical_signature(signature):
+    # Tables are stored with the stronger side as white; the other orientation is probed by flipping colours
+    white, black = parse_signature(signature)
+    strength = lambda pieces: sorted((PIECE_STRENGTH[piece] for piece in pieces), reverse=True)
+    if (strength(black), black) > (strength(white), white):
+        white, black = black, white
+    return make_signature(white, black)
+
+
+def signature_columns(signature):
+    white, black = parse_signature(signature)
+    return ([PIECE_COLUMNS['K']] + [PIECE_COLUMNS[piece] for piece in white] +
+            [PIECE_COLUMNS['K'] + 6] + [PIECE_COLUMNS[piece] + 6 for piece in black])
+
+
+def material_signature(bitboards):
+    counts = [bin(board).count('1') for board in bitboards]
+    if counts[5] != 1 or counts[11] != 1:
+        return None
+    white = ''.join(piece * counts[PIECE_COLUMNS[piece]] for piece in PIECE_ORDER[1:])
+    black = ''.join(piece * counts[PIECE_COLUMNS[piece] + 6] for piece in PIECE_ORDER[1:])
+    return make_signature(white, black)
+
+
+def flip_bitboards(bitboards):
+    # Swap colours and mirror ranks, which maps every position onto its colour-reversed twin
+    mirror = lambda board: int.from_bytes(board.to_bytes(8, 'little'), 'big')
+    return [mirror(board) for board in bitboards[6:]] + [mirror(board) for board in bitboards[:6]]
+
+
+def position_index(columns, bitboards, turn):
+    # Squares of identical pieces are listed in ascending order, so each position has one index
+    index = 0
+    previous = None
+    for column in columns:
+        if column == previous:
+            continue
+        previous = column
+        for pos in squares(bitboards[column]):
+            index = index * 64 + pos
+    return index * 2 + (1 if turn == 'black' else 0)
+
+
+def index_squares(index, piece_count):
+    turn = 'black' if index & 1 else 'white'
+    index >>= 1
+    positions = []
+    for _ in range(piece_count):
+        positions.append(index % 64)
+        index //= 64
+    return list(reversed(positions)), turn
+
+
+class Table:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as table_file:
+            self.mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, signature = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an endgame table")
+        self.signature = signature.decode('ascii').strip()
+        self.columns = signature_columns(self.signature)
+
+    def value(self, bitboards, turn):
+        byte = self.mmap[HEADER.size + position_index(self.columns, bitboards, turn)]
+        return byte - 256 if byte > 127 else byte
+
+    def close(self):
+        self.mmap.close()
+
+
+class Tablebase:
+    """Distance-to-mate tables in a directory, one <signature>.tb file each, opened on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.signatures = set()
+        if os.path.isdir(directory):
+            self.signatures = {name[:-3] for name in os.listdir(directory) if name.endswith('.tb')}
+        # Bare kings are always drawn and need no file
+        self.max_pieces = max((len(signature) for signature in self.signatures), default=2)
+
+    def __getstate__(self):
+        # Worker processes map the files again instead of receiving the mappings
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def table(self, signature):
+        if signature not in self.signatures:
+            return None
+        if signature not in self.tables:
+            self.tables[signature] = Table(os.path.join(self.directory, signature + '.tb'))
+        return self.tables[signature]
+
+    def probe_bitboards(self, bitboards, turn):
+        """Table value for the side to move, or None when no table covers the position."""
+        signature = material_signature(bitboards)
+        if signature is None:
+            return None
+        if signature == 'KK':
+            return 0
+        table = self.table(signature)
+        if table is not None:
+            return table.value(bitboards, turn)
+        white, black = parse_signature(signature)
+        table = self.table(make_signature(black, white))
+        if table is not None:
+            return table.value(flip_bitboards(bitboards), 'white' if turn == 'black' else 'black')
+        return None
+
+    def probe(self, game_manager):
+        occupied = 0
+        for name in BITBOARD_NAMES:
+            occupied |= getattr(game_manager, name)
+        if bin(occupied).count('1') > self.max_pieces:
+            return None
+        return self.probe_bitboards(game_manager.get_bitboards(), game_manager.turn)
+
+    def score(self, game_manager):
+        # White-relative search score; faster mates score higher
+        value = self.probe(game_manager)
+        if value is None:
+            return None
+        if value == 0:
+            return 0
+        score = MATE_SCORE - value_plies(value) if value > 0 else -MATE_SCORE + value_plies(value)
+        return score if game_manager.turn == 'white' else -score
+
+    def best_move(self, game_manager):
+        """(score, (from_notation, to_notation)) chosen from the tables, or None if any reply is not covered."""
+        if self.probe(game_manager) is None:
+            return None
+        color = game_manager.turn
+        best = None
+        for from_pos, to_pos in game_manager.get_legal_moves(color):
+            game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+            reply = self.probe(game_manager)
+            game_manager.undo_move()
+            if reply is None:
+                return None
+            # Rank moves by our outcome: quick wins first, then draws, then the slowest losses
+            if reply < 0:
+                rank = (2, -value_plies(reply))
+            elif reply == 0:
+                rank = (1, 0)
+            else:
+                rank = (0, value_plies(reply))
+            if best is None or rank > best[0]:
+                best = (rank, reply, from_pos, to_pos)
+        if best is None:
+            return None
+        _, reply, from_pos, to_pos = best
+        if reply == 0:
+            score = 0
+        else:
+            plies = value_plies(reply) + 1
+            score = MATE_SCORE - plies if reply < 0 else -MATE_SCORE + plies
+        if color == 'black':
+            score = -score
+        return score, (game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+
+# Generation
+def dependencies(signature):
+    # Tables reached by a capture or a promotion, in canonical orientation
+    white, black = parse_signature(signature)
+    found = set()
+    for side, other in ((white, black), (black, white)):
+        for index, piece in enumerate(side):
+            rest = side[:index] + side[index + 1:]
+            found.add(canonical_signature(make_signature(rest, other)))
+            if piece == 'P':
+                found.add(canonical_signature(make_signature(rest + 'Q', other)))
+    found.discard('KK')
+    found.discard(canonical_signature(signature))
+    return found
+
+
+def _step_targets():
+    # King and knight destinations per square, as on an empty board
+    kings = [squares(mask) for mask in table('king_masks')]
+    knights = [squares(mask) for mask in table('knight_masks')]
+    return kings, knights
+
+
+def _unmove_origins(game_manager, pos, piece, color, occupied, step_targets):
+    # Empty squares from which piece could have reached pos with a quiet, non-promoting move
+    king_targets, knight_targets = step_targets
+    if piece == 'kings':
+        return [origin for origin in king_targets[pos] if not occupied & (1 << origin)]
+    if piece == 'knights':
+        return [origin for origin in knight_targets[pos] if not occupied & (1 << origin)]
+    if piece == 'pawns':
+        step = -8 if color == 'white' else 8
+        origin = pos + step
+        if not 8 <= origin < 56 or occupied & (1 << origin):
+            return []
+        origins = [origin]
+        if pos // 8 == (3 if color == 'white' else 4) and not occupied & (1 << (origin + step)):
+            origins.append(origin + step)
+        return origins
+    # Sliders retrace their own rays
+    return [origin for origin in game_manager.get_piece_moves(pos, piece, color) if not occupied & (1 << origin)]
+
+
+def generate_table(signature, directory, log=print):
+    """Build one table of at most MAX_GENERATED_PIECES pieces by retrograde analysis, assuming the tables it depends on already exist."""
+    signature = canonical_signature(signature)
+    if len(signature) > MAX_GENERATED_PIECES:
+        raise ValueError(f"'{signature}' has more than {MAX_GENERATED_PIECES} pieces")
+    columns = signature_columns(signature)
+    piece_count = len(columns)
+    size = 2 * 64 ** piece_count
+    tablebase = Tablebase(directory)
+    game_manager = GameManager()
+    step_targets = _step_targets()
+    material = [columns.count(column) for column in range(12)]
+
+    UNKNOWN, RESOLVED, INVALID = 0, 1, 2
+    values = array('b', bytes(size))
+    state = bytearray(size)
+    remaining = array('B', bytes(size))  # in-table replies not yet known to win for the opponent
+    levels = {}  # plies -> indices to resolve at that distance
+    win_exits = {}  # index -> plies of the quickest win through a capture or promotion
+    loss_exits = {}  # index -> plies of the slowest loss through a capture or promotion
+    draw_exits = set()
+
+    def schedule(plies, index):
+        levels.setdefault(plies, []).append(index)
+
+    def set_position(index):
+        positions, turn = index_squares(index, piece_count)
+        bitboards = [0] * 12
+        occupied = 0
+        for column, pos in zip(columns, positions):
+            if occupied & (1 << pos):
+                return None  # two pieces on one square
+            occupied |= 1 << pos
+            bitboards[column] |= 1 << pos
+        if position_index(columns, bitboards, turn) != index:
+            return None  # identical pieces out of order
+        if (bitboards[0] | bitboards[6]) & 0xFF000000000000FF:
+            return None  # pawns on the first or last rank
+        game_manager.set_bitboards(bitboards)
+        game_manager.move_history = []
+        game_manager.turn = turn
+        return turn
+
+    # Forward pass: classify every position and count its in-table replies
+    start = time.perf_counter()
+    for index in range(size):
+        if index % 65536 == 0 and index:
+            log(f"{signature}: forward pass {index}/{size} ({time.perf_counter() - start:.0f}s)")
+        turn = set_position(index)
+        opponent = 'black' if turn == 'white' else 'white'
+        if turn is None or game_manager.is_check(opponent):
+            state[index] = INVALID
+            continue
+        legal_moves = game_manager.get_legal_moves(turn)
+        if not legal_moves:
+            if game_manager.is_check(turn):
+                schedule(0, index)  # checkmated
+            else:
+                state[index] = RESOLVED  # stalemate
+            continue
+        in_table = 0
+        for from_pos, to_pos in legal_moves:
+            game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+            bitboards = game_manager.get_bitboards()
+            if [bin(board).count('1') for board in bitboards] == material:
+                in_table += 1
+            else:
+                reply = tablebase.probe_bitboards(bitboards, game_manager.turn)
+                if reply is None:
+                    raise RuntimeError(f"Generating {signature} needs the table for {material_signature(bitboards)}")
+                if reply == 0:
+                    draw_exits.add(index)
+                elif reply < 0:
+                    plies = value_plies(reply) + 1
+                    win_exits[index] = min(plies, win_exits.get(index, plies))
+                else:
+                    plies = value_plies(reply) + 1
+                    loss_exits[index] = max(plies, loss_exits.get(index, plies))
+            game_manager.undo_move()
+        remaining[index] = in_table
+        if index in win_exits:
+            schedule(win_exits[index], index)
+        elif in_table == 0 and index not in draw_exits:
+            schedule(loss_exits[index], index)
+
+    # Backward pass: resolve positions in order of distance to mate
+    plies = 0
+    while levels:
+        for index in levels.pop(plies, []):
+            if state[index] != UNKNOWN:
+                continue
+            # Wins are always an odd number of plies from mate, losses an even number
+            values[index] = win_value(plies) if plies % 2 == 1 else loss_value(plies)
+            state[index] = RESOLVED
+            set_position(index)
+            mover = 'black' if game_manager.turn == 'white' else 'white'
+            bitboards = game_manager.get_bitboards()
+            occupied = 0
+            for board in bitboards:
+                occupied |= board
+
+            # Every quiet move of the side that just moved leads here from a predecessor
+            predecessors = []
+            for column in sorted(set(columns)):
+                if (column < 6) != (mover == 'white'):
+                    continue
+                piece = BITBOARD_NAMES[column].split('_')[1]
+                for pos in squares(bitboards[column]):
+                    for origin in _unmove_origins(game_manager, pos, piece, mover, occupied, step_targets):
+                        previous = list(bitboards)
+                        previous[column] ^= (1 << pos) | (1 << origin)
+                        predecessors.append(position_index(columns, previous, mover))
+            # Castling, which make_move plays as a king and rook move together
+            king_column, rook_column = (5, 1) if mover == 'white' else (11, 7)
+            home = 0 if mover == 'white' else 56
+            for king_to, rook_to, rook_from, between in ((6, 5, 7, (5, 6)), (2, 3, 0, (1, 2, 3))):
+                if bitboards[king_column] == 1 << (home + king_to) and bitboards[rook_column] & (1 << (home + rook_to)):
+                    previous = list(bitboards)
+                    previous[king_column] = 1 << (home + 4)
+                    previous[rook_column] ^= (1 << (home + rook_to)) | (1 << (home + rook_from))
+                    previous_occupied = 0
+                    for board in previous:
+                        previous_occupied |= board
+                    if previous_occupied & (1 << (home + rook_to)) or occupied & (1 << (home + 4)) or occupied & (1 << (home + rook_from)):
+                        continue
+                    if all(not previous_occupied & (1 << (home + square)) for square in between):
+                        predecessors.append(position_index(columns, previous, mover))
+
+            for predecessor in predecessors:
+                if state[predecessor] != UNKNOWN:
+                    continue
+                if values[index] < 0:
+                    schedule(plies + 1, predecessor)  # moving here wins
+                else:
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0 and predecessor not in draw_exits and predecessor not in win_exits:
+                        schedule(max(plies + 1, loss_exits.get(predecessor, 0)), predecessor)
+        plies += 1
+    log(f"{signature}: resolved to {plies - 1} plies in {time.perf_counter() - start:.0f}s")
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, signature + '.tb')
+    with open(path + '.tmp', 'wb') as table_file:
+        table_file.write(HEADER.pack(MAGIC, signature.ljust(8).encode('ascii')))
+        table_file.write(values.tobytes())
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def generate(signatures, directory, log=print):
+    # Builds each requested table after the tables its captures and promotions lead to
+    built = []
+    existing = Tablebase(directory).signatures
+
+    def build(signature):
+        signature = canonical_signature(signature)
+        if signature in existing or signature in built:
+            return
+        for dependency in sorted(dependencies(signature), key=len):
+            build(dependency)
+        generate_table(signature, directory, log)
+        built.append(signature)
+
+    for signature in signatures:
+        if len(signature) > MAX_GENERATED_PIECES:
+            raise ValueError(f"'{signature}' has more than {MAX_GENERATED_PIECES} pieces")
+        build(signature)
+    return built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe distance-to-mate endgame tables.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate_parser = subparsers.add_parser('generate', help=f"build tables of up to {MAX_GENERATED_PIECES} pieces, e.g. KQK KRK KPK")
+    generate_parser.add_argument('signatures', nargs='+')
+    generate_parser.add_argument('--dir', default='tablebases')
+    probe_parser = subparsers.add_parser('probe', help="look up a FEN")
+    probe_parser.add_argument('fen')
+    probe_parser.add_argument('--dir', default='tablebases')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        try:
+            built = generate(args.signatures, args.dir)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"Built {', '.join(built) or 'nothing new'} in {args.dir}")
+        return 0
+
+    tablebase = Tablebase(args.dir)
+    game_manager = GameManager()
+    game_manager.load_fen(args.fen)
+    value = tablebase.probe(game_manager)
+    if value is None:
+        print("No table covers this position")
+        return 1
+    outcome = 'draw' if value == 0 else f"mate in {value}" if value > 0 else f"mated in {-value - 1}"
+    best = tablebase.best_move(game_manager)
+    print(f"{outcome}, best move {''.join(best[1]) if best else '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+import time
+from datetime import date
+
+from game_manager import GameManager
+from move_generator import MoveGenerator
+from pgn import move_to_san, format_pgn
+
+ENGINE_KEYS = {'name': str, 'depth': int, 'movetime': float}
+# Pseudo-games added to every result before estimating Elo or running the SPRT
+PSEUDO_GAMES = 1
+
+
+def parse_engine(text, default_name):
+    # 'depth=3' or 'name=fast,movetime=0.5'
+    config = {'name': default_name}
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        if key not in ENGINE_KEYS:
+            raise argparse.ArgumentTypeError(f"unknown engine option '{key}'")
+        config[key] = ENGINE_KEYS[key](value)
+    if 'depth' not in config and 'movetime' not in config:
+        config['depth'] = 2
+    return config
+
+
+def parse_sprt(text):
+    # 'elo0=0,elo1=10,alpha=0.05,beta=0.05'
+    config = {'elo0': 0.0, 'elo1': 10.0, 'alpha': 0.05, 'beta': 0.05}
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        if key not in config:
+            raise argparse.ArgumentTypeError(f"unknown SPRT option '{key}'")
+        config[key] = float(value)
+    return config
+
+
+def is_insufficient_material(game_manager):
+    # Only bare kings, or a king and a single minor piece against a bare king
+    others = [getattr(game_manager, f"{color}_{piece}")
+              for color in ['white', 'black'] for piece in ['pawns', 'rooks', 'knights', 'bishops', 'queens']]
+    if any(others[i] for i in (0, 1, 4, 5, 6, 9)):
+        return False
+    return sum(bin(board).count('1') for board in others) <= 1
+
+
+def play_game(task):
+    game_index, white, black, opening_seed, opening_plies, max_plies = task
+    game_manager = GameManager()
+    engines = {'white': MoveGenerator(), 'black': MoveGenerator()}
+    configs = {'white': white, 'black': black}
+    search_time = {'white': 0.0, 'black': 0.0}
+    sans = []
+    seen = {}
+
+    def play(from_pos, to_pos, legal_moves):
+        sans.append(move_to_san(game_manager, from_pos, to_pos, legal_moves))
+        game_manager.make_move(game_manager.pos_to_notation(from_pos), game_manager.pos_to_notation(to_pos))
+
+    # Random opening plies, shared by both games of a colour-swapped pair
+    opening_rng = random.Random(opening_seed)
+    for _ in range(opening_plies):
+        legal_moves = game_manager.get_legal_moves(game_manager.turn)
+        if not legal_moves:
+            break
+        play(*opening_rng.choice(legal_moves), legal_moves)
+
+    while True:
+        color = game_manager.turn
+        legal_moves = game_manager.get_legal_moves(color)
+        if not legal_moves:
+            if game_manager.is_check(color):
+                result, termination = ('0-1' if color == 'white' else '1-0'), 'checkmate'
+            else:
+                result, termination = '1/2-1/2', 'stalemate'
+            break
+        if is_insufficient_material(game_manager):
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        position = (tuple(game_manager.get_bitboards()), color)
+        seen[position] = seen.get(position, 0) + 1
+        if seen[position] >= 3:
+            result, termination = '1/2-1/2', 'threefold repetition'
+            break
+        if len(sans) >= max_plies:
+            result, termination = '1/2-1/2', 'move limit'
+            break
+
+        config = configs[color]
+        start = time.perf_counter()
+        _, best_move = engines[color].search(game_manager, 1 if color == 'white' else -1,
+                                             depth=config.get('depth'), movetime=config.get('movetime'))
+        search_time[color] += time.perf_counter() - start
+        if best_move is None:
+            from_pos, to_pos = legal_moves[0]
+        else:
+            from_pos, to_pos = (game_manager.notation_to_pos(square) for square in best_move)
+        play(from_pos, to_pos, legal_moves)
+
+    return {
+        'index': game_index,
+        'white': white['name'],
+        'black': black['name'],
+        'result': result,
+        'termination': termination,
+        'sans': sans,
+        'nodes': engines['white'].nodes + engines['black'].nodes,
+        'search_time': search_time['white'] + search_time['black']
+    }
+
+
+def score_of(game, engine_name):
+    if game['result'] == '1/2-1/2':
+        return 0.5
+    winner = game['white'] if game['result'] == '1-0' else game['black']
+    return 1.0 if winner == engine_name else 0.0
+
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1) + 0.0
+
+
+def regularised(wins, draws, losses):
+    # Half a pseudo-win and half a pseudo-loss, so that sweeps and all-draw runs keep a finite score and a real variance
+    return wins + PSEUDO_GAMES / 2, draws, losses + PSEUDO_GAMES / 2
+
+
+def elo_estimate(wins, draws, losses):
+    # Elo difference with a 95% confidence interval from the per-game score variance
+    wins, draws, losses = regularised(wins, draws, losses)
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo_from_score(score), elo_from_score(score - margin), elo_from_score(score + margin)
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    # Log-likelihood ratio of H1 (elo1) against H0 (elo0), normal approximation on the game score
+    if wins + draws + losses == 0:
+        return 0.0
+    wins, draws, losses = regularised(wins, draws, losses)
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    score0 = 1 / (1 + 10 ** (-elo0 / 400))
+    score1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return (score1 - score0) * (2 * score - score0 - score1) / (2 * variance / games)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine games without the GUI.")
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--engine1', type=lambda text: parse_engine(text, 'engine1'), default=parse_engine('', 'engine1'),
+                        help="options for the first engine, e.g. depth=3 or movetime=0.5")
+    parser.add_argument('--engine2', type=lambda text: parse_engine(text, 'engine2'), default=parse_engine('', 'engine2'))
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--opening-plies', type=int, default=4, help="random plies played before the engines take over")
+    parser.add_argument('--max-plies', type=int, default=200, help="adjudicate a draw after this many plies")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--pgn', default=None, help="file the finished games are appended to")
+    parser.add_argument('--sprt', type=parse_sprt, default=None, help="stop early, e.g. elo0=0,elo1=10,alpha=0.05,beta=0.05")
+    args = parser.parse_args(argv)
+
+    engine1, engine2 = args.engine1, args.engine2
+    if engine1['name'] == engine2['name']:
+        engine2['name'] += '-2'
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+
+    # Engines swap colours every game; each pair of games shares an opening
+    tasks = []
+    for game_index in range(args.games):
+        white, black = (engine1, engine2) if game_index % 2 == 0 else (engine2, engine1)
+        tasks.append((game_index, white, black, seed + game_index // 2, args.opening_plies, args.max_plies))
+
+    if args.sprt:
+        lower = math.log(args.sprt['beta'] / (1 - args.sprt['alpha']))
+        upper = math.log((1 - args.sprt['beta']) / args.sprt['alpha'])
+
+    wins = draws = losses = 0
+    total_nodes = 0
+    total_search_time = 0.0
+    sprt_verdict = None
+    start = time.perf_counter()
+    pgn_file = open(args.pgn, 'a') if args.pgn else None
+    try:
+        with multiprocessing.Pool(processes=args.processes) as pool:
+            for game in pool.imap_unordered(play_game, tasks):
+                score = score_of(game, engine1['name'])
+                wins += score == 1.0
+                draws += score == 0.5
+                losses += score == 0.0
+                total_nodes += game['nodes']
+                total_search_time += game['search_time']
+
+                headers = {
+                    'Event': 'Engine match',
+                    'Site': 'tournament.py',
+                    'Date': date.today().strftime('%Y.%m.%d'),
+                    'Round': game['index'] + 1,
+                    'White': game['white'],
+                    'Black': game['black'],
+                    'Termination': game['termination']
+                }
+                if pgn_file:
+                    pgn_file.write(format_pgn(headers, game['sans'], game['result']))
+                    pgn_file.flush()
+                print(f"Game {game['index'] + 1}: {game['white']} - {game['black']} {game['result']} "
+                      f"({game['termination']}, {len(game['sans'])} plies)  "
+                      f"+{wins} ={draws} -{losses}", flush=True)
+
+                if args.sprt:
+                    llr = sprt_llr(wins, draws, losses, args.sprt['elo0'], args.sprt['elo1'])
+                    if llr >= upper:
+                        sprt_verdict = f"H1 accepted (LLR {llr:.2f} >= {upper:.2f})"
+                    elif llr <= lower:
+                        sprt_verdict = f"H0 accepted (LLR {llr:.2f} <= {lower:.2f})"
+                    if sprt_verdict:
+                        break
+    finally:
+        if pgn_file:
+            pgn_file.close()
+
+    games = wins + draws + losses
+    wall_time = time.perf_counter() - start
+    print()
+    print(f"{engine1['name']} vs {engine2['name']}: {games} games, +{wins} ={draws} -{losses}")
+    if games:
+        elo, elo_low, elo_high = elo_estimate(wins, draws, losses)
+        print(f"Elo difference: {elo:+.1f} (95% interval {elo_low:+.1f} to {elo_high:+.1f})")
+    if args.sprt:
+        print(f"SPRT: {sprt_verdict or 'inconclusive'}")
+    print(f"Nodes: {total_nodes}, {total_nodes / max(total_search_time, 1e-9):.0f} nps per process, "
+          f"{total_nodes / max(wall_time, 1e-9):.0f} nps overall in {wall_time:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
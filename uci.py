@@ -0,0 +1,245 @@
+import re
+import sys
+import threading
+import time
+
+from analysis_cache import AnalysisCache
+from game_manager import GameManager, STARTING_FEN
+from move_generator import MoveGenerator
+from opening_book import OpeningBook
+from tablebase import Tablebase, MATE_SCORE
+
+ENGINE_NAME = 'Chess-COSC3100'
+ENGINE_AUTHOR = 'Chess-COSC3100 contributors'
+# String options; an empty value turns the feature off
+OPTIONS = {'Book': OpeningBook, 'Tablebases': Tablebase, 'AnalysisCache': AnalysisCache}
+MAX_DEPTH = 64
+# Underpromotions are refused, since pawns always become queens in this engine
+UCI_MOVE = re.compile(r'[a-h][1-8][a-h][1-8]q?')
+
+
+def parse_go(tokens):
+    # go depth 4 movetime 1000 nodes 50000 wtime ... btime ... winc ... binc ... movestogo ... infinite
+    limits = {}
+    index = 0
+    while index < len(tokens):
+        name = tokens[index]
+        if name == 'infinite':
+            limits['infinite'] = True
+        elif name in ('depth', 'movetime', 'nodes', 'wtime', 'btime', 'winc', 'binc', 'movestogo') and index + 1 < len(tokens):
+            limits[name] = int(tokens[index + 1])
+            index += 1
+        index += 1
+    return limits
+
+
+def move_to_uci(game_manager, move):
+    # Long algebraic notation; pawns reaching the last rank always become queens here
+    from_notation, to_notation = move
+    piece, color = game_manager.get_piece_at_position(game_manager.notation_to_pos(from_notation))
+    promotion = 'q' if piece == 'pawns' and game_manager.is_pawn_promotion(game_manager.notation_to_pos(to_notation), color) else ''
+    return from_notation + to_notation + promotion
+
+
+def format_score(score, depth):
+    # UCI scores are from the side to move: centipawns, or moves to mate when one is found.
+    # Search mates are plain infinities, so their distance is bounded by the depth that first saw them.
+    if abs(score) == float('inf'):
+        moves = (depth + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    if abs(score) >= MATE_SCORE - 1000:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {round(score * 100)}"
+
+
+class UCIEngine:
+    """Reads UCI commands and answers on stdout; searches run on a background thread so 'stop' is heard."""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.game_manager = GameManager()
+        self.game_manager.setup_board()
+        self.position = (STARTING_FEN, [])
+        self.move_generator = MoveGenerator()
+        self.search_thread = None
+        self.search_limits = {}
+        self.stop_event = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """Process one command line; returns False on 'quit'."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            for name in OPTIONS:
+                self.send(f"option name {name} type string default <empty>")
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.wait_for_search()
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.wait_for_search()
+            self.set_position(STARTING_FEN, [])
+        elif command == 'position':
+            self.wait_for_search()
+            self.handle_position(arguments)
+        elif command == 'go':
+            self.wait_for_search()
+            self.start_search(parse_go(arguments))
+        elif command == 'stop':
+            self.wait_for_search(stop=True)
+        elif command == 'quit':
+            self.wait_for_search(stop=True)
+            return False
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def set_option(self, arguments):
+        # setoption name <name> value <value>
+        if 'name' not in arguments:
+            return
+        value_at = arguments.index('value') if 'value' in arguments else len(arguments)
+        name = ' '.join(arguments[arguments.index('name') + 1:value_at])
+        value = ' '.join(arguments[value_at + 1:])
+        if name not in OPTIONS:
+            self.send(f"info string unknown option {name}")
+            return
+        attribute = {'Book': 'book', 'Tablebases': 'tablebase', 'AnalysisCache': 'cache'}[name]
+        try:
+            setattr(self.move_generator, attribute, OPTIONS[name](value) if value and value != '<empty>' else None)
+        except (OSError, ValueError) as error:
+            self.send(f"info string cannot load {name}: {error}")
+
+    def handle_position(self, arguments):
+        # position startpos|fen <fen> [moves <move> ...]
+        moves_at = arguments.index('moves') if 'moves' in arguments else len(arguments)
+        if arguments[:1] == ['startpos']:
+            fen = STARTING_FEN
+        elif arguments[:1] == ['fen']:
+            fen = ' '.join(arguments[1:moves_at])
+        else:
+            self.send("info string position needs startpos or fen")
+            return
+        self.set_position(fen, arguments[moves_at + 1:])
+
+    def set_position(self, fen, moves):
+        # GUIs resend the whole game every move, so only the new moves are played when the game just grew
+        current_fen, current_moves = self.position
+        if fen != current_fen or moves[:len(current_moves)] != current_moves:
+            try:
+                self.game_manager.load_fen(fen)
+            except ValueError as error:
+                # load_fen left the board untouched; forget what it holds so the next position reloads in full
+                self.send(f"info string invalid fen: {error}")
+                self.position = (None, [])
+                return
+            current_moves = []
+        for index in range(len(current_moves), len(moves)):
+            if not self.play_uci_move(moves[index]):
+                self.send(f"info string illegal move {moves[index]}")
+                moves = moves[:index]
+                break
+        self.position = (fen, list(moves))
+
+    def play_uci_move(self, text):
+        game_manager = self.game_manager
+        if not UCI_MOVE.fullmatch(text):
+            return False
+        from_pos, to_pos = game_manager.notation_to_pos(text[:2]), game_manager.notation_to_pos(text[2:4])
+        piece, color = game_manager.get_piece_at_position(from_pos)
+        if color != game_manager.turn or to_pos not in game_manager.get_piece_moves(from_pos, piece, color):
+            return False
+        game_manager.make_move(text[:2], text[2:4])
+        return True
+
+    def start_search(self, limits):
+        self.stop_event.clear()
+        self.search_limits = limits
+        self.search_thread = threading.Thread(target=self.search, args=(limits,), daemon=True)
+        self.search_thread.start()
+
+    def wait_for_search(self, stop=False):
+        # Commands that arrive mid-search queue behind it, as scripted input expects; only stop and quit cut it short
+        if self.search_thread is not None:
+            if stop or self.search_limits.get('infinite'):
+                self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def time_budget(self, limits):
+        # Seconds to spend on this move, or None to search until depth, nodes or 'stop'
+        if 'movetime' in limits:
+            return limits['movetime'] / 1000
+        side = 'w' if self.game_manager.turn == 'white' else 'b'
+        if f'{side}time' not in limits:
+            return None
+        remaining = limits[f'{side}time'] / 1000
+        increment = limits.get(f'{side}inc', 0) / 1000
+        moves_to_go = limits.get('movestogo', 30)
+        return max(min(remaining / moves_to_go + increment * 0.75, remaining * 0.5), 0.01)
+
+    def search(self, limits):
+        game_manager = self.game_manager
+        move_generator = self.move_generator
+        color = 1 if game_manager.turn == 'white' else -1
+        start = time.perf_counter()
+        budget = self.time_budget(limits)
+        deadline = start + budget if budget is not None else None
+        node_limit = limits.get('nodes')
+        max_depth = min(limits.get('depth', MAX_DEPTH), MAX_DEPTH)
+
+        move_generator.nodes = 0
+
+        def report(score, move, pv, depth):
+            elapsed = time.perf_counter() - start
+            # Walk the line so that promotions further down it are spotted
+            pv_moves = []
+            for pv_move in pv:
+                pv_moves.append(move_to_uci(game_manager, pv_move))
+                game_manager.make_move(*pv_move)
+            for _ in pv:
+                game_manager.undo_move()
+            self.send(f"info depth {depth} score {format_score(color * score, depth)} nodes {move_generator.nodes} "
+                      f"nps {int(move_generator.nodes / max(elapsed, 1e-9))} time {int(elapsed * 1000)} pv {' '.join(pv_moves)}")
+
+        def should_stop():
+            return (self.stop_event.is_set()
+                    or deadline is not None and time.perf_counter() >= deadline
+                    or node_limit is not None and move_generator.nodes >= node_limit)
+
+        _, best_move, _, _ = move_generator.iterative_search(game_manager, color, max_depth, should_stop, report)
+
+        if limits.get('infinite'):
+            self.stop_event.wait()  # 'go infinite' only reports its move after 'stop'
+        if best_move is None:
+            # Stopped before depth 1 finished: any legal move beats forfeiting
+            legal_moves = game_manager.get_legal_moves(game_manager.turn)
+            if legal_moves:
+                best_move = tuple(game_manager.pos_to_notation(pos) for pos in legal_moves[0])
+        self.send(f"bestmove {move_to_uci(game_manager, best_move) if best_move else '0000'}")
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.wait_for_search()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+from precomputed import table
+
+# One key per square for each bitboard, in BITBOARD_NAMES order, then the black-to-move key.
+# Copied out of the mapping into lists, which hash_bitboards indexes faster.
+_keys = table('zobrist')
+PIECE_KEYS = [list(_keys[index * 64:(index + 1) * 64]) for index in range(12)]
+BLACK_TO_MOVE_KEY = _keys[12 * 64]
+
+
+def hash_bitboards(bitboards, turn):
+    # Castling rights are implied by the piece placement in this engine, so no extra keys are needed
+    key = 0
+    for keys, board in zip(PIECE_KEYS, bitboards):
+        while board:
+            key ^= keys[(board & -board).bit_length() - 1]
+            board &= board - 1
+    if turn == 'black':
+        key ^= BLACK_TO_MOVE_KEY
+    return key